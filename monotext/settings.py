@@ -83,6 +83,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, to count all the queries of a request (see 'posts/middleware.py')
+    'posts.middleware.QueryStatsMiddleware',
+    # Before the sessions, to see their writes too (see 'posts/routers.py')
+    'posts.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,13 +123,115 @@ WSGI_APPLICATION = 'monotext.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# The connections are kept (one per thread) for DJANGO_CONN_MAX_AGE seconds instead of one per request
+# ("0" to close them after every request), and checked before being reused by a new request.
+# Their counts are in the staff's '/stats/' (see 'posts/backends/sqlite3/base.py').
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'posts.backends.sqlite3',  # Django's, with 'POSTS_SQLITE_TRANSACTION_MODE' and the counts
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas (copies of "default" kept up to date by e.g. Litestream/LiteFS), as DJANGO_DATABASE_REPLICAS
+# comma separated paths, the read-only views read from them (see 'posts/routers.py').
+# A session that wrote reads from "default" for the next POSTS_REPLICA_STICKY_SECONDS (more than the replication lag).
+POSTS_READ_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('DJANGO_DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    POSTS_READ_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+POSTS_REPLICA_STICKY_SECONDS = 5
+
+# The pragmas set on every new SQLite connection (see 'posts/sqlite.py'), DJANGO_SQLITE_PROFILE picks the profile.
+# "rollback" is SQLite's defaults (the readers wait for the writers), it is also the way back from "production"
+# since the journal mode is stored in the database file.
+SQLITE_PROFILES = {
+    'rollback': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # Safe with WAL, a power loss can only lose the last commits
+        'busy_timeout': int(os.environ.get('DJANGO_SQLITE_BUSY_TIMEOUT', 5000)),  # In milliseconds
+        'mmap_size': int(os.environ.get('DJANGO_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),  # In bytes
+        'cache_size': -int(os.environ.get('DJANGO_SQLITE_CACHE_KIB', 64 * 1024)),  # Negative means KiB, not pages
+        'temp_store': 'MEMORY',
+    },
+}
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'production')
+POSTS_SQLITE_PRAGMAS = SQLITE_PROFILES[SQLITE_PROFILE]
+
+# The writing transactions ('atomic()') take the write lock first (waiting for it up to the busy timeout),
+# instead of failing when they read before writing while another one writes (see 'posts/backends/sqlite3')
+POSTS_SQLITE_TRANSACTION_MODE = 'IMMEDIATE' if SQLITE_PROFILE == 'production' else 'DEFERRED'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory by default (one cache per process),
+# set DJANGO_CACHE_BACKEND to "file", "redis" or "memcached" (and DJANGO_CACHE_LOCATION) to share it between processes.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'monotext'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', BASE_DIR / 'cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'),  # Needs 'redis' installed
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),  # Needs 'pymemcache'
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[os.environ.get('DJANGO_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', CACHE_LOCATION),
+    }
+}
+
+# With a cache shared between the processes, the sessions are read from the cache (written to both),
+# and the session's user too (see 'posts/auth.py'), so a logged in request doesn't query either of them.
+# Not with the local memory cache: a process would keep a logged out session (or a changed password) for itself.
+if CACHE_BACKEND != CACHE_BACKENDS['locmem'][0]:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = [
+        'posts.auth.CachedModelBackend',
+        # For the sessions logged in before the cached backend (they aren't cached until logging in again)
+        'django.contrib.auth.backends.ModelBackend',
+    ]
+POSTS_USER_CACHE_TIMEOUT = 300
+
+# How long (in seconds) the JSON of likes/comments stays cached, even without any new likes/comments
+POSTS_CACHE_TIMEOUT = 60
+
+# How long (in seconds) the shared part of a post's card stays cached, even without any changes to the post
+POSTS_CARD_CACHE_TIMEOUT = 60
+
+# How many of the newest posts' ids the home page's precomputed (cached) timeline keeps,
+# and how long (in seconds) before it is rebuilt from the database anyway
+POSTS_TIMELINE_SIZE = 300
+POSTS_TIMELINE_TIMEOUT = 300
+
+# The posts of users with more followers than this aren't pushed into their followers' feeds when written,
+# they are pulled when the feeds are read (see 'posts/feed.py')
+POSTS_FEED_PUSH_LIMIT = 1000
+
+# How many of a user's newest posts go into a new follower's feed
+POSTS_FEED_BACKFILL = 100
+
+# The trending posts are ranked by (likes + POSTS_TRENDING_COMMENT_WEIGHT * comments) / (age in hours + 2) ** gravity
+# (Hacker News' formula), over the posts of the last POSTS_TRENDING_WINDOW_HOURS, re-decayed every
+# POSTS_TRENDING_INTERVAL seconds by 'manage.py recompute_trending' (see 'posts/models.py')
+POSTS_TRENDING_GRAVITY = 1.8
+POSTS_TRENDING_COMMENT_WEIGHT = 1
+POSTS_TRENDING_WINDOW_HOURS = 48
+POSTS_TRENDING_INTERVAL = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -183,5 +289,63 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 
+# Search backend: "fts5" (SQLite's full-text index, plain 'LIKE' queries on other databases),
+# "memory" (an inverted index in each process's memory, see 'posts/inverted_index.py') or "database" ('LIKE' queries)
+POSTS_SEARCH_BACKEND = os.environ.get('POSTS_SEARCH_BACKEND', 'fts5')
+
+# Search: match the query's words as prefixes too (e.g. 'fo' finds 'foo')
+POSTS_SEARCH_PREFIX = True
+
+# The "memory" search backend memory-maps its index from this file (written by 'manage.py build_search_index'),
+# or builds it from the database if the file is missing
+POSTS_SEARCH_INDEX_PATH = BASE_DIR / 'search_index.bin'
+
+# How often (in seconds) the "memory" search backend indexes the posts saved since its file was written,
+# or by the other processes
+POSTS_SEARCH_SYNC_INTERVAL = 5
+
+# The most posts the "memory" search backend returns for a query
+POSTS_SEARCH_MAX_RESULTS = 1000
+
+# How the likes/comments counts reach the live streams (see 'posts/events.py'): "memory" (this process's streams only)
+# or "cache" (through the shared cache, polled every POSTS_EVENTS_POLL_INTERVAL seconds, for more than one process)
+POSTS_EVENTS_BROKER = os.environ.get('POSTS_EVENTS_BROKER', 'memory')
+POSTS_EVENTS_POLL_INTERVAL = 0.5
+
+# How long (in seconds) a live stream stays open before the browser has to reconnect
+POSTS_EVENTS_STREAM_TIMEOUT = 300
+
+# Requests that make more queries than this are logged as warnings (see 'posts/middleware.py'),
+# the transaction control statements (BEGIN, SAVEPOINT, ...) aren't counted
+POSTS_QUERY_BUDGET = 10
+
+# Buffer the likes/dislikes and write them every POSTS_LIKES_FLUSH_INTERVAL seconds (see 'posts/likes_buffer.py'),
+# the pending ones are also appended to a journal in POSTS_LIKES_JOURNAL_DIR (if set) to be written after a crash
+POSTS_LIKES_WRITE_BEHIND = os.environ.get('POSTS_LIKES_WRITE_BEHIND', '') == 'True'
+POSTS_LIKES_FLUSH_INTERVAL = 1
+POSTS_LIKES_JOURNAL_DIR = os.environ.get('POSTS_LIKES_JOURNAL_DIR') or None
+
+# Logging
+# https://docs.djangoproject.com/en/4.2/topics/logging/
+# Every request's queries are logged by the "posts.queries" logger,
+# set DJANGO_QUERY_LOG_LEVEL to "INFO" to see all of them (only the requests over the budget are shown by default)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'posts.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('DJANGO_QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 # To only test the reset password (this will send the email to terminal)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -0,0 +1,32 @@
+"""
+The session's user (with its picture, for the templates) cached for 'POSTS_USER_CACHE_TIMEOUT' seconds,
+so that with the "cached_db" sessions a logged in request makes no queries to know who it is.
+The user's cache is dropped whenever the user or its picture is saved or deleted (see 'signals.py'),
+in every process as long as the cache is shared between them (only then is this backend used, see 'settings.py').
+"""
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from .models import User
+
+
+def _user_key(user_id):
+    return f"posts:user:{user_id}"
+
+
+def invalidate_user(user_id):
+    cache.delete(_user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = User._default_manager.select_related("user_picture").filter(pk=user_id).first()
+            if user is None:
+                return None
+            # Cached even without a picture (the 'select_related()' remembers there is none)
+            cache.set(key, user, getattr(settings, "POSTS_USER_CACHE_TIMEOUT", 300))
+        return user if self.user_can_authenticate(user) else None
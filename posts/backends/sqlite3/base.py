@@ -0,0 +1,75 @@
+import threading
+import time
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+# The connections of this process (one per thread and database, kept for 'CONN_MAX_AGE' seconds),
+# "reused" counts the requests that started with an open connection
+_connection_totals = {
+    "opened": 0,
+    "closed": 0,
+    "maxOpen": 0,
+    "connectMs": 0.0,
+    "reused": 0,
+    "healthCheckFailures": 0,
+}
+_connection_totals_lock = threading.Lock()
+
+
+def connection_stats():
+    with _connection_totals_lock:
+        totals = dict(_connection_totals)
+    totals["open"] = totals["opened"] - totals["closed"]
+    # Every request (using the database) either reuses a connection or opens one
+    checkouts = totals["reused"] + totals["opened"]
+    totals["reuseRate"] = totals["reused"] / checkouts if checkouts else 0
+    totals["connectMsPerConnection"] = totals["connectMs"] / totals["opened"] if totals["opened"] else 0
+    return totals
+
+
+def record_reuse(connection):
+    """ Count a request starting on the connection if it is still open (see 'signals.py') """
+    if isinstance(connection, DatabaseWrapper) and connection.connection is not None:
+        with _connection_totals_lock:
+            _connection_totals["reused"] += 1
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Django's SQLite backend, with the transactions started as 'POSTS_SQLITE_TRANSACTION_MODE'
+    (like Django 5.1's "transaction_mode" option), and its connections counted and timed.
+    "IMMEDIATE" takes the write lock at 'BEGIN', waiting for it up to the busy timeout,
+    where a "DEFERRED" transaction that reads before it writes fails at once with "database is locked"
+    when another one wrote in the meantime.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        mode = getattr(settings, "POSTS_SQLITE_TRANSACTION_MODE", "DEFERRED")
+        if mode not in ("DEFERRED", "IMMEDIATE", "EXCLUSIVE"):
+            raise ValueError(f"Invalid SQLite transaction mode: {mode}")
+        self.cursor().execute(f"BEGIN {mode}")
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        # With the 'connection_created' receivers (e.g. the pragmas)
+        duration = time.perf_counter() - start
+        with _connection_totals_lock:
+            _connection_totals["opened"] += 1
+            _connection_totals["connectMs"] += duration * 1000
+            _connection_totals["maxOpen"] = max(
+                _connection_totals["maxOpen"], _connection_totals["opened"] - _connection_totals["closed"])
+
+    def close(self):
+        was_open = self.connection is not None
+        super().close()
+        if was_open and self.connection is None:
+            with _connection_totals_lock:
+                _connection_totals["closed"] += 1
+
+    def close_if_health_check_failed(self):
+        was_open = self.connection is not None
+        super().close_if_health_check_failed()
+        if was_open and self.connection is None:
+            with _connection_totals_lock:
+                _connection_totals["healthCheckFailures"] += 1
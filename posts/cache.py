@@ -0,0 +1,59 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# What can be cached for a post, each kind is invalidated on its own
+LIKES = "likes"
+COMMENTS = "comments"
+
+
+def _generation_key(kind, post_pk):
+    return f"posts:{kind}:{post_pk}:generation"
+
+
+def _new_generation():
+    # Never one of the generations before it, even if the generation was evicted (the data may still be cached)
+    return time.time_ns()
+
+
+async def _ageneration(kind, post_pk):
+    key = _generation_key(kind, post_pk)
+    generation = await cache.aget(key)
+    if generation is None:
+        # Another request may start it at the same time
+        await cache.aadd(key, _new_generation(), timeout=None)
+        generation = await cache.aget(key, 0)
+    return generation
+
+
+async def acached_json(kind, post_pk, variant, build):
+    """
+    Return the cached data of the post's 'kind' (e.g. its likes) for the 'variant' (e.g. the page or cursor),
+    or 'await build()' it and cache it until the post's 'kind' is invalidated (or 'POSTS_CACHE_TIMEOUT' passes,
+    as the data has 'naturaltime' dates that get old).
+    """
+    key = f"posts:{kind}:{post_pk}:{await _ageneration(kind, post_pk)}:{variant}"
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, timeout=getattr(settings, "POSTS_CACHE_TIMEOUT", 60))
+    return data
+
+
+def _bump_generation(kind, post_pk):
+    key = _generation_key(kind, post_pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Nothing was cached for it yet (or it was evicted)
+        cache.set(key, _new_generation(), timeout=None)
+
+
+def invalidate(kind, post_pk):
+    """
+    Drop all the cached data of the post's 'kind' (every page/cursor of it at once, by moving to a new generation),
+    now and again when the transaction commits, so a concurrent request can't cache the old data in between.
+    """
+    _bump_generation(kind, post_pk)
+    transaction.on_commit(lambda: _bump_generation(kind, post_pk))
@@ -0,0 +1,172 @@
+"""
+Live likes/comments counts of the posts, published from the write paths ('signals.py')
+and streamed to the browsers (Server-Sent Events, see 'PostEventsView') by a broker:
+  - "memory": an in-process pub/sub, it only reaches the streams of the process that wrote the like/comment.
+  - "cache": a stand-in for a real pub/sub server (e.g. Redis) when running more than one process,
+    the events are appended to a log in the shared cache (the "file" or "redis" cache backends)
+    and every process polls it for its streams.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+EVENTS_SEQUENCE_KEY = "posts:events:sequence"
+
+# The counts in the events, and their fields on the post
+COUNT_FIELDS = {
+    "likes": "like_count",
+    "comments": "comment_count",
+}
+
+
+def _event_key(sequence):
+    return f"posts:events:{sequence}"
+
+
+class Subscription:
+    """ The events of some posts for a stream, delivered into an 'asyncio.Queue' on the stream's event loop """
+
+    def __init__(self, post_ids, max_pending=100):
+        self.post_ids = set(post_ids)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_pending)
+
+    def deliver(self, event):
+        """ Called from any thread """
+        if event["post"] in self.post_ids:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client misses the older counts, the newer ones have them anyway
+            self.queue.get_nowait()
+            self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class MemoryBroker:
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.add(subscription)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def wants(self, post_id):
+        """ Whether any stream is waiting for the post's events (to skip publishing the ones nobody reads) """
+        with self.lock:
+            return any(post_id in subscription.post_ids for subscription in self.subscriptions)
+
+    def publish(self, event):
+        self.dispatch(event)
+
+    def dispatch(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+class CacheBroker(MemoryBroker):
+    """ Every process polls the events log in the shared cache, while it has any subscriptions """
+
+    def __init__(self):
+        super().__init__()
+        self.poller = None
+
+    def subscribe(self, subscription):
+        super().subscribe(subscription)
+        with self.lock:
+            if self.poller is None or not self.poller.is_alive():
+                self.poller = threading.Thread(target=self.poll, name="posts-events", daemon=True)
+                self.poller.start()
+
+    def wants(self, post_id):
+        # The other processes' streams are unknown
+        return True
+
+    def publish(self, event):
+        cache.add(EVENTS_SEQUENCE_KEY, 0, timeout=None)
+        sequence = cache.incr(EVENTS_SEQUENCE_KEY)
+        cache.set(_event_key(sequence), event, timeout=60)
+
+    def poll(self):
+        interval = getattr(settings, "POSTS_EVENTS_POLL_INTERVAL", 0.5)
+        last = cache.get(EVENTS_SEQUENCE_KEY, 0)
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                if not self.subscriptions:
+                    # A new subscription starts a new poller
+                    self.poller = None
+                    return
+            try:
+                sequence = cache.get(EVENTS_SEQUENCE_KEY, 0)
+                if sequence > last:
+                    events = cache.get_many([_event_key(n) for n in range(last + 1, sequence + 1)])
+                    for n in range(last + 1, sequence + 1):
+                        if _event_key(n) in events:
+                            self.dispatch(events[_event_key(n)])
+                    last = sequence
+            except Exception:
+                logger.exception("Can't read the events from the cache.")
+
+
+BROKERS = {
+    "memory": MemoryBroker,
+    "cache": CacheBroker,
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = BROKERS[getattr(settings, "POSTS_EVENTS_BROKER", "memory")]()
+        return _broker
+
+
+def subscribe(post_ids):
+    """ Start receiving the events of the posts, on the current event loop """
+    subscription = Subscription(post_ids)
+    get_broker().subscribe(subscription)
+    return subscription
+
+
+def unsubscribe(subscription):
+    get_broker().unsubscribe(subscription)
+
+
+def publish_counts(post_id, counts, delta):
+    """
+    Publish the post's new likes/comments count ('counts' is "likes" or "comments") and its change,
+    once the transaction commits (the streams must not see a count that may be rolled back).
+    """
+    def publish():
+        broker = get_broker()
+        if not broker.wants(post_id):
+            return
+        count = Post.objects.filter(pk=post_id).values_list(COUNT_FIELDS[counts], flat=True).first()
+        if count is not None:
+            broker.publish({"post": post_id, counts: count, f"{counts}Delta": delta})
+    transaction.on_commit(publish)
@@ -0,0 +1,98 @@
+"""
+The users' home feeds (the posts of the users they follow, and their own posts), delivered in two ways:
+  - Pushed: a new post is copied into each follower's feed entries when it is written,
+    so a feed page is a range scan of its owner's entries.
+  - Pulled: the posts of users with more than 'POSTS_FEED_PUSH_LIMIT' followers aren't pushed
+    (one post would write too many entries), so they are read from the posts table with the feed.
+"""
+
+import heapq
+from django.conf import settings
+from django.db.models import Q
+from .models import Post, Follow, FeedEntry
+
+
+def _push_limit():
+    return getattr(settings, "POSTS_FEED_PUSH_LIMIT", 1000)
+
+
+def fan_out(post):
+    """ Push a new post into its owner's followers' feeds, unless the owner has too many followers """
+    followers = Follow.objects.filter(followed_id=post.owner_id)
+    if followers.count() > _push_limit():
+        Post.objects.filter(pk=post.pk).update(fanned_out=False)
+        post.fanned_out = False
+        return
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(owner_id=follower_id, post_id=post.pk, post_created_at=post.created_at)
+            for follower_id in followers.values_list("follower_id", flat=True).iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def follow(follower, followed):
+    """ Make 'follower' follow 'followed', with the newest pushed posts of 'followed' in the feed right away """
+    _, created = Follow.objects.get_or_create(follower=follower, followed=followed)
+    if created:
+        posts = (
+            Post.objects
+            .filter(owner=followed, fanned_out=True)
+            .order_by("-created_at")
+            .values_list("pk", "created_at")[:getattr(settings, "POSTS_FEED_BACKFILL", 100)]
+        )
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(owner=follower, post_id=pk, post_created_at=created_at)
+                for pk, created_at in posts
+            ],
+            ignore_conflicts=True,
+        )
+    return created
+
+
+def unfollow(follower, followed):
+    Follow.objects.filter(follower=follower, followed=followed).delete()
+    FeedEntry.objects.filter(owner=follower, post__owner=followed).delete()
+
+
+def _older_than(created_at_field, id_field, created_at, pk):
+    return (
+        Q(**{f"{created_at_field}__lt": created_at})
+        | Q(**{created_at_field: created_at, f"{id_field}__lt": pk})
+    )
+
+
+def feed_post_ids(user, count, before=None):
+    """
+    The ids of the 'count' newest posts of the user's feed (older than the 'before' (created_at, id), if given),
+    merging the pushed entries with the pulled posts, newest first.
+    """
+    pushed = FeedEntry.objects.filter(owner=user)
+    pulled = Post.objects.filter(
+        Q(owner=user)
+        | Q(owner__in=Follow.objects.filter(follower=user).values("followed"), fanned_out=False)
+    )
+    if before is not None:
+        pushed = pushed.filter(_older_than("post_created_at", "post_id", *before))
+        pulled = pulled.filter(_older_than("created_at", "id", *before))
+    pushed = pushed.order_by("-post_created_at", "-post_id").values_list("post_created_at", "post_id")
+    pulled = pulled.order_by("-created_at", "-id").values_list("created_at", "id")
+    merged = heapq.merge(pushed[:count], pulled[:count], reverse=True)
+    ids = []
+    for _, pk in merged:
+        if pk not in ids:
+            ids.append(pk)
+        if len(ids) == count:
+            break
+    return ids
+
+
+def feed_page(user, paginator, cursor=None):
+    """ The feed's page after the cursor (or its first page) from the paginator of the feed's posts """
+    decoded = paginator.decode_cursor(cursor) if cursor else None
+    # The feed is only walked forward
+    before = decoded[1:] if decoded is not None and decoded[0] == paginator.NEXT else None
+    return paginator.page_from_ids(feed_post_ids(user, paginator.per_page + 1, before))
@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+
+# The postings are sorted arrays of 64-bit document ids
+POSTING_TYPE = "q"
+FILE_MAGIC = b"MTINDEX2"
+
+
+def tokenize(text):
+    """ Split the text into lowercase words (the same words SQLite's FTS5 'unicode61' tokenizer sees) """
+    return re.findall(r"\w+", text.casefold())
+
+
+def _contains(postings, doc_id):
+    i = bisect_left(postings, doc_id)
+    return i < len(postings) and postings[i] == doc_id
+
+
+def _intersect(a, b):
+    """ Intersect two sorted postings, stepping through the shorter one and bisecting the longer one """
+    if len(a) > len(b):
+        a, b = b, a
+    result = array(POSTING_TYPE)
+    lo = 0
+    for doc_id in a:
+        lo = bisect_left(b, doc_id, lo)
+        if lo == len(b):
+            break
+        if b[lo] == doc_id:
+            result.append(doc_id)
+    return result
+
+
+class InvertedIndex:
+    """
+    An in-memory inverted index: a sorted array of document ids (postings) for each word.
+    It is updated in place when a document is added or removed,
+    and can be saved to a file and memory-mapped back from it (the postings stay on disk until changed).
+    """
+
+    def __init__(self):
+        self._postings = {}  # word -> array (or a read-only memoryview of the mapped file)
+        self._doc_words = {}  # doc id -> its words, to remove it without scanning all the postings
+        self._file_docs = array(POSTING_TYPE)  # The sorted ids of the documents loaded from the file (words unknown)
+        self.synced_until = None  # Saved with the index, e.g. up to when the documents were indexed
+        self._words = None  # The sorted words for prefix lookups, built on demand
+        self._mmap = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._postings)
+
+    def _writable(self, word):
+        postings = self._postings.get(word)
+        if postings is None:
+            postings = self._postings[word] = array(POSTING_TYPE)
+            self._words = None
+        elif not isinstance(postings, array):
+            postings = self._postings[word] = array(POSTING_TYPE, postings)
+        return postings
+
+    def add(self, doc_id, text):
+        """ Index the document (replacing its old version if it was indexed before) """
+        with self._lock:
+            self.remove(doc_id)
+            words = set(tokenize(text))
+            for word in words:
+                postings = self._writable(word)
+                if not postings or postings[-1] < doc_id:
+                    # New documents have the greatest ids, so this is the usual case
+                    postings.append(doc_id)
+                else:
+                    postings.insert(bisect_left(postings, doc_id), doc_id)
+            self._doc_words[doc_id] = tuple(words)
+
+    def remove(self, doc_id):
+        with self._lock:
+            words = self._doc_words.pop(doc_id, None)
+            if words is None:
+                if not _contains(self._file_docs, doc_id):
+                    # Never indexed (e.g. a new document)
+                    return
+                # Indexed before loading the file, so look for it in all of the postings
+                words = [
+                    word for word, postings in self._postings.items()
+                    if _contains(postings, doc_id)
+                ]
+            for word in words:
+                postings = self._writable(word)
+                i = bisect_left(postings, doc_id)
+                if i < len(postings) and postings[i] == doc_id:
+                    del postings[i]
+                if not postings:
+                    del self._postings[word]
+                    self._words = None
+
+    def _lookup(self, word, prefix):
+        if not prefix:
+            return self._postings.get(word, array(POSTING_TYPE))
+        if self._words is None:
+            self._words = sorted(self._postings)
+        matches = array(POSTING_TYPE)
+        i = bisect_left(self._words, word)
+        while i < len(self._words) and self._words[i].startswith(word):
+            matches.extend(self._postings[self._words[i]])
+            i += 1
+        return array(POSTING_TYPE, sorted(set(matches)))
+
+    def search(self, query, prefix=True, limit=None):
+        """ Return the ids of the documents having all of the query's words, newest (greatest id) first """
+        words = set(tokenize(query))
+        if not words:
+            return []
+        with self._lock:
+            # Start with the rarest word, so the intersections shrink as fast as possible
+            postings = sorted((self._lookup(word, prefix) for word in words), key=len)
+            result = postings[0]
+            for other in postings[1:]:
+                if not result:
+                    break
+                result = _intersect(result, other)
+            result = list(reversed(result))
+        return result[:limit] if limit is not None else result
+
+    def save(self, path):
+        """
+        Write the index as a JSON header (each word's postings offset and length, the documents' offset and length,
+        and 'synced_until'), followed by all the postings, then the sorted ids of all the documents,
+        as one block of 64-bit integers.
+        """
+        with self._lock:
+            words = {}
+            offset = 0
+            for word, postings in self._postings.items():
+                words[word] = (offset, len(postings))
+                offset += len(postings)
+            docs = array(POSTING_TYPE, sorted(set().union(*self._postings.values())))
+            header = json.dumps({
+                "words": words,
+                "docs": (offset, len(docs)),
+                "synced_until": self.synced_until,
+            }).encode()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(FILE_MAGIC)
+                f.write(len(header).to_bytes(8, "little"))
+                f.write(header)
+                # Align the postings block to the size of its integers
+                f.write(b"\0" * (-(len(FILE_MAGIC) + 8 + len(header)) % 8))
+                for postings in self._postings.values():
+                    array(POSTING_TYPE, postings).tofile(f)
+                docs.tofile(f)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Memory-map an index saved by 'save()', its postings are only read from the file when searched """
+        index = cls()
+        with open(path, "rb") as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError(f"'{path}' is not a search index file.")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length))
+            start = len(FILE_MAGIC) + 8 + header_length
+            start += -start % 8
+            index.synced_until = header["synced_until"]
+            if not header["words"]:
+                return index
+            index._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        block = memoryview(index._mmap)[start:].cast(POSTING_TYPE)
+        for word, (offset, length) in header["words"].items():
+            index._postings[word] = block[offset:offset + length]
+        offset, length = header["docs"]
+        index._file_docs = block[offset:offset + length]
+        return index
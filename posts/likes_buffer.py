@@ -0,0 +1,261 @@
+"""
+Write-behind likes, when 'POSTS_LIKES_WRITE_BEHIND' is on: the like/dislike toggles are kept in this process's memory
+(and appended to a journal file in 'POSTS_LIKES_JOURNAL_DIR', if set, to survive a crash), answered right away with
+the optimistic likes count, and written every 'POSTS_LIKES_FLUSH_INTERVAL' seconds in one transaction,
+instead of taking SQLite's single writer lock on every click.
+The last toggle of a (post, user) wins, so a quick like/dislike/like is one write (or none at all).
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from .cache import LIKES, invalidate
+from .events import publish_counts
+from .models import Post, Like, UserStats, liked_by
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled():
+    return getattr(settings, "POSTS_LIKES_WRITE_BEHIND", False)
+
+
+class LikesBuffer:
+    def __init__(self, journal_dir=None):
+        # (post id, owner id) -> (liked, liked in the database)
+        self.pending = {}
+        # Post id -> how far the pending toggles move its likes count
+        self.deltas = defaultdict(int)
+        self.lock = threading.Lock()
+        # The toggles being written by a flush (one at a time), and how many flushes were done
+        self.flush_lock = threading.Lock()
+        self.in_flight = {}
+        self.flushes = 0
+        self.journal_dir = journal_dir
+        self.journal_number = 0
+        self.flusher = None
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+            self.recover()
+
+    def journal_path(self, suffix="jsonl"):
+        return os.path.join(self.journal_dir, f"likes-{os.getpid()}.{suffix}")
+
+    def record(self, post_id, owner_id, liked, liked_in_db, flushes=None):
+        """
+        Keep the toggle (the database has 'liked_in_db' for it, unless another toggle of it is pending or being
+        written), or return 'False' if a flush was done since 'liked_in_db' was read (when there were 'flushes').
+        """
+        key = (post_id, owner_id)
+        with self.lock:
+            if flushes is not None and flushes != self.flushes:
+                return False
+            if key in self.pending:
+                old_liked, liked_in_db = self.pending.pop(key)
+                self.deltas[post_id] -= old_liked - liked_in_db
+            elif key in self.in_flight:
+                liked_in_db = self.in_flight[key][0]
+            if liked != liked_in_db:
+                self.pending[key] = (liked, liked_in_db)
+                self.deltas[post_id] += liked - liked_in_db
+            if not self.deltas[post_id]:
+                del self.deltas[post_id]
+            if self.journal_dir:
+                self.journal([(key, liked)])
+        self.start_flusher()
+        return True
+
+    def journal(self, toggles):
+        """ Append the [((post id, owner id), liked)] toggles to this process's journal (under 'self.lock') """
+        with open(self.journal_path(), "a") as journal:
+            for (post_id, owner_id), liked in toggles:
+                journal.write(json.dumps([post_id, owner_id, liked]) + "\n")
+
+    def pending_like(self, post_id, owner_id):
+        """ Whether the user's pending toggle of the post is a like, or 'None' if there is none """
+        with self.lock:
+            return self.pending.get((post_id, owner_id), (None,))[0]
+
+    def delta(self, post_id):
+        with self.lock:
+            return self.deltas.get(post_id, 0)
+
+    def start_flusher(self):
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.flush_periodically, name="posts-likes", daemon=True)
+                self.flusher.start()
+                atexit.register(self.flush)
+
+    def flush_periodically(self):
+        while True:
+            time.sleep(getattr(settings, "POSTS_LIKES_FLUSH_INTERVAL", 1))
+            # Like a request, this thread's connection is dropped once it is too old or broken
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Can't write the pending likes, they are kept for the next try.")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """ Write the pending toggles in one transaction, return how many (the failed ones are pending again) """
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                self.deltas.clear()
+                self.in_flight = pending
+                flushing = None
+                if self.journal_dir and os.path.exists(self.journal_path()):
+                    # The next toggles go to a new journal, this one is dropped once its toggles are written
+                    self.journal_number += 1
+                    flushing = self.journal_path(f"{self.journal_number}.flushing")
+                    os.replace(self.journal_path(), flushing)
+            written = False
+            try:
+                if pending:
+                    write_likes({key: liked for key, (liked, _) in pending.items()})
+                written = True
+            finally:
+                with self.lock:
+                    if not written:
+                        self.restore(pending, journal=bool(flushing))
+                    self.in_flight = {}
+                    self.flushes += 1
+                if flushing:
+                    os.remove(flushing)
+            return len(pending)
+
+    def restore(self, toggles, journal):
+        """ Make the toggles of a failed flush pending again (under 'self.lock'), the newer toggles of them on top """
+        restored = []
+        for key, (liked, liked_in_db) in toggles.items():
+            newer = self.pending.pop(key, None)
+            if newer is not None:
+                # It was recorded against the state the flush would have written
+                self.deltas[key[0]] -= newer[0] - newer[1]
+                liked = newer[0]
+            else:
+                restored.append((key, liked))
+            if liked != liked_in_db:
+                self.pending[key] = (liked, liked_in_db)
+                self.deltas[key[0]] += liked - liked_in_db
+            if not self.deltas[key[0]]:
+                del self.deltas[key[0]]
+        if journal:
+            # Into the current journal, the newer toggles are in it already
+            self.journal(restored)
+
+    def recover(self):
+        """ Write the toggles left in the journals of the processes that died before writing them """
+        toggles = {}
+        for name in sorted(os.listdir(self.journal_dir)):
+            parts = name.split(".")
+            if not name.startswith("likes-") or not parts[0][6:].isdigit():
+                continue
+            pid = int(parts[0][6:])
+            if pid == os.getpid() or _process_alive(pid):
+                continue
+            path = os.path.join(self.journal_dir, name)
+            try:
+                # Claim it, in case another process is recovering it too
+                claimed = path + f".{os.getpid()}.recovering"
+                os.replace(path, claimed)
+            except OSError:
+                continue
+            with open(claimed) as journal:
+                for line in journal:
+                    try:
+                        post_id, owner_id, liked = json.loads(line)
+                    except ValueError:
+                        # A line cut by the crash
+                        continue
+                    toggles[(post_id, owner_id)] = liked
+            os.remove(claimed)
+        if toggles:
+            write_likes(toggles)
+            logger.info("Recovered %d like toggle(s) from the journals.", len(toggles))
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_likes(toggles):
+    """ Apply the {(post id, owner id): liked} toggles, in one transaction """
+    likes = [key for key, liked in toggles.items() if liked]
+    dislikes = [key for key, liked in toggles.items() if not liked]
+    liked_posts = {post_id for post_id, _ in likes}
+    with transaction.atomic():
+        # The posts (or users) may be gone since
+        existing_posts = set(Post.objects.filter(pk__in=liked_posts).values_list("pk", flat=True))
+        Like.objects.bulk_create(
+            [Like(post_id=post_id, owner_id=owner_id) for post_id, owner_id in likes if post_id in existing_posts],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        # 'bulk_create()' skips the signals (and doesn't tell which likes were new), so recount these posts
+        Post.objects.filter(pk__in=existing_posts).recount()
+        UserStats.objects.refresh(Post.objects.filter(pk__in=existing_posts).values_list("owner", flat=True).distinct())
+        for post_id in existing_posts:
+            invalidate(LIKES, post_id)
+            publish_counts(post_id, "likes", 0)
+        # The deleted likes go through the signals, as usual
+        for start in range(0, len(dislikes), 200):
+            batch = dislikes[start:start + 200]
+            Like.objects.filter(reduce(or_, (Q(post_id=p, owner_id=o) for p, o in batch))).delete()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = LikesBuffer(getattr(settings, "POSTS_LIKES_JOURNAL_DIR", None))
+        return _buffer
+
+
+def toggle_like(post_id, user, liked):
+    """
+    Record a like (or a dislike) of the post by the user, to be written later,
+    and return the optimistic (likes count, liked) or 'None' if there is no such post.
+    """
+    buffer = get_buffer()
+    while True:
+        # Read again if a flush was done in the meantime, it may have changed the stored like state
+        flushes = buffer.flushes
+        state = (
+            Post.objects.filter(pk=post_id).annotate(liked=liked_by(user)).values_list("like_count", "liked").first()
+        )
+        if state is None:
+            return None
+        like_count, liked_in_db = state
+        if buffer.record(post_id, user.pk, liked, liked_in_db, flushes):
+            return max(0, like_count + buffer.delta(post_id)), liked
+
+
+def overlay(post_id, user, like_count, liked):
+    """ The stored (likes count, liked) of the post with the pending toggles on top """
+    if not write_behind_enabled() or _buffer is None:
+        return like_count, liked
+    pending = _buffer.pending_like(post_id, user.pk) if user.is_authenticated else None
+    return max(0, like_count + _buffer.delta(post_id)), liked if pending is None else pending
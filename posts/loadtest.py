@@ -0,0 +1,292 @@
+"""
+A load generator that replays the traffic of 'static/js/main.js' against a running server, with asyncio:
+each virtual user logs in, loads a page of posts, then, after some think time, likes/dislikes a post (answered
+with its new likes count), opens a likes list, opens a post's page (where 'main.js' fetches the first comments
+chunk on load), fetches more comments there, or moves to the next page.
+The URLs are reversed from this project's URLconf, the server is expected to run the same one.
+"""
+
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from django.urls import Resolver404, resolve, reverse
+
+# What a virtual user does after loading a page, and how often (relative weights)
+DEFAULT_MIX = {
+    "toggle_like": 3,
+    "like_list": 1,
+    "post_detail": 2,
+    "more_comments": 2,
+    "next_page": 2,
+    "reload": 1,
+}
+
+POST_IDS_PATTERN = re.compile(r'id="post-comments-url-(\d+)"')
+LIKED_PATTERN = re.compile(r'style="display: none;"\s*id="like-btn-(\d+)"')
+NEXT_CURSOR_PATTERN = re.compile(r'data-cursor="([^"]+)"\s*href="[^"]*">Next</a>')
+CSRF_PATTERN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+LINK_PATTERN = re.compile(r'href="([^"#?]+)"')
+
+
+class HTTPError(Exception):
+    pass
+
+
+class Connection:
+    """ A minimal HTTP/1.1 keep-alive client (one request at a time), with the cookies of one browser """
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, form=None):
+        """ Return (status, headers, body), reconnecting once if the server closed the kept-alive connection """
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout)
+            try:
+                return await asyncio.wait_for(self._request(method, path, form), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+
+    async def _request(self, method, path, form):
+        body = urlencode(form).encode() if form is not None else b""
+        headers = {
+            "Host": f"{self.host}:{self.port}",
+            "Connection": "keep-alive",
+            "Content-Length": str(len(body)),
+        }
+        if form is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+        head = f"{method} {path} HTTP/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        self.writer.write(head.encode() + b"\r\n" + body)
+        await self.writer.drain()
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while (line := await self.reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "set-cookie":
+                for cookie in SimpleCookie(value).values():
+                    self.cookies[cookie.key] = cookie.value
+            response_headers[name] = value
+        if response_headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while size := int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            await self.reader.readexactly(2)
+            response_body = b"".join(chunks)
+        else:
+            response_body = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, response_headers, response_body
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.start = time.perf_counter()
+        self.end = None
+
+    def record(self, endpoint, latency, ok):
+        self.latencies[endpoint].append(latency)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self):
+        duration = (self.end or time.perf_counter()) - self.start
+        summary = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            summary[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "throughput": len(latencies) / duration,
+                **{
+                    f"p{percent}": latencies[min(len(latencies) - 1, round(percent / 100 * (len(latencies) - 1)))]
+                    for percent in (50, 95, 99)
+                },
+                "max": latencies[-1],
+                "mean": statistics.mean(latencies),
+            }
+        return {"duration": duration, "endpoints": summary}
+
+
+class VirtualUser:
+    def __init__(self, number, options, stats):
+        url = urlsplit(options["url"])
+        self.connection = Connection(url.hostname, url.port or 80, options["timeout"])
+        self.username = f"{options['username_prefix']}{number}"
+        self.password = options["password"]
+        self.think_time = options["think_time"]
+        self.mix = options["mix"]
+        self.stats = stats
+        self.random = random.Random(number)
+        self.csrf_token = ""
+        self.page_url = reverse("posts:index")
+        self.next_page_url = None
+        self.posts = []
+        self.detail_urls = []
+        self.liked = set()
+        self.comments_cursors = {}
+
+    async def call(self, endpoint, method, path, form=None, follow=True):
+        start = time.perf_counter()
+        try:
+            status, headers, body = await self.connection.request(method, path, form)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as error:
+            self.stats.record(endpoint, time.perf_counter() - start, False)
+            raise HTTPError(f"{method} {path}: {error!r}") from error
+        self.stats.record(endpoint, time.perf_counter() - start, status < 400)
+        if follow and status in (301, 302) and "location" in headers:
+            # Like the browser's 'fetch()', a redirect costs another request
+            location = urlsplit(headers["location"])
+            target = location.path + (f"?{location.query}" if location.query else "")
+            return await self.call(self.endpoint_of(target), "GET", target)
+        return status, body
+
+    @staticmethod
+    def view_of(path):
+        try:
+            return resolve(urlsplit(path).path).view_name
+        except Resolver404:
+            return None
+
+    @classmethod
+    def endpoint_of(cls, path):
+        return {"login": "login", "posts:post_likes": "likes_count"}.get(cls.view_of(path), "redirect")
+
+    async def think(self):
+        if self.think_time:
+            await asyncio.sleep(self.random.expovariate(1 / self.think_time))
+
+    async def log_in(self):
+        _, body = await self.call("login", "GET", reverse("login"))
+        match = CSRF_PATTERN.search(body.decode())
+        self.csrf_token = match[1] if match else self.connection.cookies.get("csrftoken", "")
+        await self.call("login", "POST", reverse("login"), {
+            **self.csrf_form(),
+            "username": self.username,
+            "password": self.password,
+        }, follow=False)
+        # The token is rotated on log in
+        self.csrf_token = self.connection.cookies.get("csrftoken", self.csrf_token)
+        return "sessionid" in self.connection.cookies
+
+    async def load_page(self, url):
+        detail = self.view_of(url) == "posts:post_detail"
+        _, body = await self.call("post_detail" if detail else "page", "GET", url)
+        html = body.decode()
+        self.page_url = url
+        self.posts = POST_IDS_PATTERN.findall(html)
+        self.detail_urls = sorted({link for link in LINK_PATTERN.findall(html)
+                                   if self.view_of(link) == "posts:post_detail"})
+        self.liked = set(LIKED_PATTERN.findall(html))
+        match = NEXT_CURSOR_PATTERN.search(html)
+        self.next_page_url = f"{reverse('posts:index')}?cursor={match[1]}" if match else None
+        match = CSRF_PATTERN.search(html)
+        if match:
+            self.csrf_token = match[1]
+        # 'main.js' fetches the first comments chunk on load, only on a post's page (the cards' comments are links)
+        self.comments_cursors = {}
+        if detail:
+            for post_id in self.posts:
+                await self.comments_chunk(post_id)
+
+    async def comments_chunk(self, post_id):
+        url = reverse("posts:post_comments", kwargs={"post_pk": post_id}) + "?limit=5"
+        if self.comments_cursors.get(post_id):
+            url += "&after=" + self.comments_cursors[post_id]
+        _, body = await self.call("comments", "GET", url)
+        data = json.loads(body or b"{}")
+        self.comments_cursors[post_id] = data.get("nextCursor") if data.get("hasNext") else None
+
+    def csrf_form(self):
+        return {"csrfmiddlewaretoken": self.csrf_token}
+
+    async def toggle_like(self):
+        post_id = self.random.choice(self.posts)
+        if post_id in self.liked:
+            url = reverse("posts:post_dislike", kwargs={"post_pk": post_id})
+            await self.call("dislike", "POST", url, self.csrf_form())
+            self.liked.discard(post_id)
+        else:
+            url = reverse("posts:post_like", kwargs={"post_pk": post_id})
+            await self.call("like", "POST", url, self.csrf_form())
+            self.liked.add(post_id)
+
+    async def like_list(self):
+        url = reverse("posts:post_like_list", kwargs={"post_pk": self.random.choice(self.posts)})
+        await self.call("like_list", "GET", url + "?limit=20")
+
+    async def post_detail(self):
+        if self.detail_urls:
+            await self.load_page(self.random.choice(self.detail_urls))
+
+    async def more_comments(self):
+        post_ids = [post_id for post_id, cursor in self.comments_cursors.items() if cursor]
+        if post_ids:
+            await self.comments_chunk(self.random.choice(post_ids))
+
+    async def run(self, deadline):
+        try:
+            await self.log_in()
+            await self.load_page(self.page_url)
+            while time.perf_counter() < deadline:
+                await self.think()
+                action = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+                try:
+                    if action == "next_page":
+                        await self.load_page(self.next_page_url or reverse("posts:index"))
+                    elif action == "reload" or not self.posts:
+                        await self.load_page(self.page_url)
+                    else:
+                        await getattr(self, action)()
+                except HTTPError:
+                    await self.think()
+        except HTTPError:
+            pass
+        finally:
+            await self.connection.close()
+
+
+async def run_load_test(options):
+    """ Run 'options["users"]' virtual users for 'options["duration"]' seconds and return the stats' summary """
+    stats = Stats()
+    deadline = time.perf_counter() + options["duration"]
+    users = [VirtualUser(number, options, stats) for number in range(options["users"])]
+    tasks = []
+    for user in users:
+        tasks.append(asyncio.create_task(user.run(deadline)))
+        # Ramp the users up instead of logging all of them in at once
+        await asyncio.sleep(options["ramp_up"] / max(1, len(users)))
+    await asyncio.gather(*tasks)
+    stats.end = time.perf_counter()
+    return stats.summary()
@@ -0,0 +1,73 @@
+import statistics
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from posts import feed, timeline
+from posts.models import Post, Follow
+from posts.pagination import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the feed's write (fan-out) and read latencies for authors with different follower counts, "
+        "on throwaway data that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--followers",
+            nargs="+",
+            type=int,
+            default=[10, 100, 1000, 10000],
+            help="The follower counts to measure.",
+        )
+        parser.add_argument("--posts", type=int, default=30, help="How many posts the author writes.")
+        parser.add_argument("--reads", type=int, default=50, help="How many times a follower reads the feed.")
+
+    def handle(self, *args, **options):
+        # The p95 needs at least two reads
+        if options["reads"] < 2:
+            raise CommandError("--reads must be at least 2.")
+        if options["posts"] < 1:
+            raise CommandError("--posts must be at least 1.")
+        if min(options["followers"]) < 1:
+            raise CommandError("--followers must be at least 1 (one of them reads the feed).")
+        self.stdout.write(
+            f"Pushing posts of authors with up to {getattr(settings, 'POSTS_FEED_PUSH_LIMIT', 1000)} followers.")
+        self.stdout.write(f"{'followers':>10} {'mode':>5} {'write p50 (ms)':>15} {'read p50 (ms)':>14} {'read p95 (ms)':>14}")
+        for follower_count in options["followers"]:
+            with transaction.atomic():
+                writes, reads, mode = self.measure(follower_count, options["posts"], options["reads"])
+                transaction.set_rollback(True)
+            # The timeline got the rolled back posts
+            timeline.build_timeline()
+            self.stdout.write(
+                f"{follower_count:>10} {mode:>5} {statistics.median(writes):>15.2f} "
+                f"{statistics.median(reads):>14.2f} {statistics.quantiles(reads, n=20)[-1]:>14.2f}"
+            )
+
+    def measure(self, follower_count, post_count, read_count):
+        author = User.objects.create(username="benchmark-author", password="!")
+        followers = User.objects.bulk_create(
+            [User(username=f"benchmark-follower-{i}", password="!") for i in range(follower_count)],
+            batch_size=500,
+        )
+        Follow.objects.bulk_create(
+            [Follow(follower=follower, followed=author) for follower in followers],
+            batch_size=500,
+        )
+        reader = User.objects.get(username="benchmark-follower-0")
+        writes = []
+        for i in range(post_count):
+            start = time.perf_counter()
+            post = Post.objects.create(title=f"Post #{i}", text="Benchmark post.", owner=author)
+            writes.append((time.perf_counter() - start) * 1000)
+        reads = []
+        for _ in range(read_count):
+            start = time.perf_counter()
+            paginator = CursorPaginator(Post.objects.for_feed(reader), 3)
+            list(feed.feed_page(reader, paginator))
+            reads.append((time.perf_counter() - start) * 1000)
+        return writes, reads, "push" if post.fanned_out else "pull"
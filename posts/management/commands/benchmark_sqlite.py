@@ -0,0 +1,105 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from posts.loadtest import run_load_test
+from .loadtest import parse_mix
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the load test (see 'loadtest') against a development server started with each SQLite profile "
+        "('SQLITE_PROFILES' in the settings) in turn, on the current database, and compare their throughput, "
+        "errors (e.g. \"database is locked\") and latencies, reads and writes apart. The servers get this "
+        "command's environment, e.g. run it with DJANGO_CONN_MAX_AGE=0 and again without to compare the connections."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profiles",
+            nargs="*",
+            default=list(settings.SQLITE_PROFILES),
+            help="The profiles to compare (all of them by default).",
+        )
+        parser.add_argument("--port", type=int, default=8011, help="Where to start the servers.")
+        parser.add_argument("--users", type=int, default=16, help="How many virtual users at once.")
+        parser.add_argument("--duration", type=float, default=20, help="How long to load each profile (in seconds).")
+        parser.add_argument("--think-time", type=float, default=0, help="The mean pause between a user's actions.")
+        parser.add_argument(
+            "--mix",
+            nargs="*",
+            default=["toggle_like=6"],
+            metavar="ACTION=WEIGHT",
+            help="Change the actions' weights (more likes/dislikes than 'loadtest' by default, to contend on writes).",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["profiles"]) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(unknown)}.")
+        load_options = {
+            "url": f"http://127.0.0.1:{options['port']}",
+            "users": options["users"],
+            "duration": options["duration"],
+            "think_time": options["think_time"],
+            "ramp_up": 1,
+            "timeout": 30,
+            "username_prefix": "synthetic-",
+            "password": "benchmark",
+            "mix": parse_mix(options["mix"]),
+        }
+        results = {}
+        for profile in options["profiles"]:
+            server = subprocess.Popen(
+                [sys.executable, "manage.py", "runserver", f"127.0.0.1:{options['port']}", "--noreload"],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, "DJANGO_SQLITE_PROFILE": profile},
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                if not wait_for_server(options["port"]):
+                    raise CommandError(f"The server didn't start for the '{profile}' profile.")
+                self.stdout.write(f"Loading the '{profile}' profile...")
+                results[profile] = asyncio.run(run_load_test(load_options))
+            finally:
+                server.terminate()
+                server.wait()
+
+        self.stdout.write(
+            f"{options['users']} users, latencies in ms (reads: page/comments/like_list, writes: like/dislike):"
+        )
+        self.stdout.write(
+            f"{'profile':>12} {'req/s':>8} {'errors':>7} {'read p50':>9} {'read p95':>9} "
+            f"{'write p50':>10} {'write p95':>10}"
+        )
+        for profile, summary in results.items():
+            endpoints = summary["endpoints"]
+            total = sum(result["requests"] for result in endpoints.values())
+            errors = sum(result["errors"] for result in endpoints.values())
+
+            def worst(names, key):
+                values = [endpoints[name][key] * 1000 for name in names if name in endpoints]
+                return max(values) if values else 0
+            reads = ("page", "comments", "like_list")
+            writes = ("like", "dislike")
+            self.stdout.write(
+                f"{profile:>12} {total / summary['duration']:>8.1f} {errors:>7} "
+                f"{worst(reads, 'p50'):>9.1f} {worst(reads, 'p95'):>9.1f} "
+                f"{worst(writes, 'p50'):>10.1f} {worst(writes, 'p95'):>10.1f}"
+            )
@@ -0,0 +1,165 @@
+import json
+import re
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from posts.models import Post
+
+# The query count of the 'Server-Timing' header (see 'posts/middleware.py')
+QUERIES_PATTERN = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, round(percent / 100 * (len(samples) - 1)))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the latency (p50/p95/p99), the queries and the memory of each request of the main views "
+        "against the current database, optionally filling it up to each of the '--scale' post counts first "
+        "(with 'generate_data'), and save the results as JSON to compare them between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            nargs="*",
+            type=int,
+            default=[],
+            help="Add synthetic posts up to these counts (e.g. 10000 100000 1000000), benchmarking at each one.",
+        )
+        parser.add_argument("--requests", type=int, default=50, help="How many requests per view.")
+        parser.add_argument("--cold", action="store_true", help="Clear the cache before each request.")
+        parser.add_argument("--output", help="Where to save the results ('benchmarks/<commit>.json' by default).")
+        parser.add_argument("--compare", help="Earlier results to compare the p50 latencies with.")
+
+    def handle(self, *args, **options):
+        results = {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "requests": options["requests"],
+            "cold": options["cold"],
+            "scales": {},
+        }
+        for scale in options["scale"] or [None]:
+            if scale is not None:
+                self.fill_up(scale)
+            post_count = Post.objects.count()
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{post_count} posts:"))
+            results["scales"][str(post_count)] = self.benchmark(options["requests"], options["cold"])
+        output = options["output"] or settings.BASE_DIR / "benchmarks" / f"{results['commit']}.json"
+        output = settings.BASE_DIR / output
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Saved the results to '{output}'."))
+        if options["compare"]:
+            self.compare(json.loads((settings.BASE_DIR / options["compare"]).read_text()), results)
+
+    def fill_up(self, scale):
+        missing = scale - Post.objects.count()
+        if missing > 0:
+            self.stdout.write(f"Adding {missing} posts...")
+            call_command(
+                "generate_data",
+                users=max(1, missing // 10),
+                posts=missing,
+                seed=scale,
+                stdout=self.stdout,
+            )
+
+    def endpoints(self):
+        """ The urls to request, on the most popular post and the most prolific user """
+        post = Post.objects.select_related("owner").order_by("-like_count", "-comment_count").first()
+        owner = User.objects.annotate(posts=Count("post")).order_by("-posts").first()
+        if post is None or owner is None:
+            return {}
+        word = post.text.split()[0].strip(".").lower()
+        return {
+            "index": reverse("posts:index"),
+            "trending": reverse("posts:trending"),
+            "profile": reverse("posts:profile", kwargs={"username": owner.username}),
+            "post_detail": reverse("posts:post_detail", kwargs={"username": post.owner.username, "post_pk": post.pk}),
+            "search": reverse("posts:post_search") + f"?q={word}",
+            "post_comments": reverse("posts:post_comments", kwargs={"post_pk": post.pk}) + "?limit=5",
+            "like_list": reverse("posts:post_like_list", kwargs={"post_pk": post.pk}) + "?limit=20",
+        }
+
+    def benchmark(self, request_count, cold):
+        client = Client(HTTP_HOST="localhost")
+        user = User.objects.filter(username__startswith="synthetic-").first()
+        if user is not None:
+            client.force_login(user)
+        results = {}
+        self.stdout.write(
+            f"{'view':>14} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'queries':>8} {'peak (KiB)':>11}")
+        for name, url in self.endpoints().items():
+            # Warm up the caches (unless '--cold') and the database's pages
+            client.get(url)
+            latencies = []
+            queries = []
+            for _ in range(request_count):
+                if cold:
+                    cache.clear()
+                start = time.perf_counter()
+                response = client.get(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+                match = QUERIES_PATTERN.search(response.get("Server-Timing", ""))
+                queries.append(int(match[1]) if match else 0)
+            # Tracing the allocations slows the request down, so it is measured alone
+            if cold:
+                cache.clear()
+            tracemalloc.start()
+            client.get(url)
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+            results[name] = {
+                "url": url,
+                "status": response.status_code,
+                "p50": statistics.median(latencies),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "queries": statistics.mean(queries),
+                "peakKiB": peak,
+            }
+            self.stdout.write(
+                f"{name:>14} {results[name]['p50']:>9.2f} {results[name]['p95']:>9.2f} "
+                f"{results[name]['p99']:>9.2f} {results[name]['queries']:>8.1f} {peak:>11.1f}"
+            )
+        # The process's peak resident memory (in KiB on Linux)
+        results["maxRssKiB"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return results
+
+    def compare(self, before, after):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"p50 (ms): {before['commit']} -> {after['commit']}"))
+        for scale, views in after["scales"].items():
+            for name, result in views.items():
+                old = before["scales"].get(scale, {}).get(name)
+                if not isinstance(result, dict) or not old:
+                    continue
+                change = (result["p50"] - old["p50"]) / old["p50"] * 100 if old["p50"] else 0
+                self.stdout.write(f"{scale:>8} {name:>14} {old['p50']:>9.2f} -> {result['p50']:>9.2f} ({change:+.1f}%)")
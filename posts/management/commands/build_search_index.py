@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from posts.search import build_inverted_index
+
+
+class Command(BaseCommand):
+    help = "Build the inverted index of the posts and save it for the \"memory\" search backend to memory-map."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=getattr(settings, "POSTS_SEARCH_INDEX_PATH", None),
+            help="Where to save the index (POSTS_SEARCH_INDEX_PATH by default).",
+        )
+
+    def handle(self, *args, **options):
+        index = build_inverted_index()
+        index.save(options["path"])
+        self.stdout.write(self.style.SUCCESS(f"Saved the index of {len(index)} word(s) to '{options['path']}'."))
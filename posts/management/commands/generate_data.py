@@ -0,0 +1,137 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Value
+from django.utils import timezone
+from posts import timeline
+from posts.models import Post, Comment, Like, UserPicture, UserStats
+
+WORDS = (
+    "the a of to and in is it you that was for on are with as be at one have this from or had by word but what "
+    "some we can out other were all there when up use your how said an each she which do their time if will way "
+    "about many then them write would like so these her long make thing see him two has look more day could go "
+    "come did number sound no most people my over know water than call first who may down side been now find "
+    "python django sqlite cache index query server feed post comment like follow profile search stream"
+).split()
+
+
+def zipf_weights(count, skew):
+    """ The cumulative weights of 'count' ranks where the rank 'r' is 1/r**skew as popular (a few of them get most) """
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Add synthetic users, posts, comments and likes (with a skewed popularity, a few posts get most "
+        "of the likes and comments, and a few users write most of the posts), for benchmarking."
+    )
+
+    batch_size = 5000
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="How many users to add.")
+        parser.add_argument("--posts", type=int, default=10000, help="How many posts to add.")
+        parser.add_argument("--comments", type=float, default=2, help="How many comments to add per post (on average).")
+        parser.add_argument("--likes", type=float, default=5, help="How many likes to add per post (on average).")
+        parser.add_argument("--skew", type=float, default=1.1, help="The skew of the popularity (0 for a uniform one).")
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=30,
+            help="Date the posts over this many days up to now (the newest ones have the greatest ids).",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="The random seed, the same seed adds the same data.")
+        parser.add_argument(
+            "--password",
+            default="benchmark",
+            help="The password of the new users (they are named 'synthetic-<number>').",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["posts"] < 1:
+            raise CommandError("Add at least one user and one post.")
+        self.random = random.Random(options["seed"])
+        with transaction.atomic():
+            users = self.add_users(options["users"], options["password"])
+            posts = self.add_posts(users, options["posts"], options["skew"])
+            self.spread_dates(posts, options["days"])
+            # The same posts are the popular ones for both the comments and the likes (in any order of creation)
+            ranked_posts = self.random.sample(posts, len(posts))
+            popularity = zipf_weights(len(posts), options["skew"])
+            comments = self.add_comments(users, ranked_posts, popularity, int(options["posts"] * options["comments"]))
+            likes = self.add_likes(users, ranked_posts, popularity, int(options["posts"] * options["likes"]))
+            # 'bulk_create()' skips the signals that keep these up to date
+            new_posts = Post.objects.filter(pk__range=(min(posts), max(posts)))
+            new_posts.recount()
+            new_posts.recompute_trending()
+            UserStats.objects.refresh(users)
+        timeline.build_timeline()
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {len(users)} user(s), {len(posts)} post(s), {comments} comment(s) and {likes} like(s)."))
+
+    def text(self, min_words, max_words):
+        return " ".join(self.random.choices(WORDS, k=self.random.randint(min_words, max_words))).capitalize() + "."
+
+    def add_users(self, count, password):
+        # Hashing is slow, all the users share the same hash
+        password = make_password(password)
+        # Number them after the ones added before
+        first = User.objects.filter(username__startswith="synthetic-").count()
+        users = User.objects.bulk_create(
+            [User(username=f"synthetic-{i}", password=password) for i in range(first, first + count)],
+            batch_size=self.batch_size,
+        )
+        UserPicture.objects.bulk_create(
+            [UserPicture(user=user, picture_path=self.random.randint(0, 1)) for user in users],
+            batch_size=self.batch_size,
+        )
+        return [user.pk for user in users]
+
+    def in_batches(self, model, count, make):
+        """ Create 'count' objects of the model, 'make()'-ing them a batch at a time (to bound the memory) """
+        objects = []
+        for start in range(0, count, self.batch_size):
+            batch = model.objects.bulk_create(
+                [make() for _ in range(min(self.batch_size, count - start))],
+                ignore_conflicts=model is Like,  # A random user may like a post twice
+            )
+            objects.extend(obj.pk for obj in batch)
+        return objects
+
+    def add_posts(self, users, count, skew):
+        authors = zipf_weights(len(users), skew)
+        return self.in_batches(Post, count, lambda: Post(
+            title=self.text(1, 5)[:128],
+            text=self.text(5, 60),
+            owner_id=self.random.choices(users, cum_weights=authors)[0],
+        ))
+
+    def spread_dates(self, posts, days):
+        """ Date the posts evenly over the last 'days' days by their ids, in one UPDATE ('bulk_create()' dates them now) """
+        first, last = min(posts), max(posts)
+        step = timedelta(days=days) / (last - first + 1)
+        date = ExpressionWrapper(
+            Value(timezone.now() - timedelta(days=days), output_field=DateTimeField())
+            + ExpressionWrapper((F("pk") - first) * Value(step), output_field=DurationField()),
+            output_field=DateTimeField(),
+        )
+        Post.objects.filter(pk__range=(first, last)).update(created_at=date, updated_at=date)
+
+    def add_comments(self, users, posts, popularity, count):
+        self.in_batches(Comment, count, lambda: Comment(
+            text=self.text(2, 30),
+            post_id=self.random.choices(posts, cum_weights=popularity)[0],
+            owner_id=self.random.choice(users),
+        ))
+        return count
+
+    def add_likes(self, users, posts, popularity, count):
+        self.in_batches(Like, count, lambda: Like(
+            post_id=self.random.choices(posts, cum_weights=popularity)[0],
+            owner_id=self.random.choice(users),
+        ))
+        return Like.objects.filter(post_id__gte=min(posts), post_id__lte=max(posts)).count()
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand, CommandError
+from posts.loadtest import DEFAULT_MIX, run_load_test
+
+
+def parse_mix(values):
+    mix = dict(DEFAULT_MIX)
+    for value in values:
+        action, _, weight = value.partition("=")
+        if action not in DEFAULT_MIX:
+            raise CommandError(f"Unknown action '{action}', choose from: {', '.join(DEFAULT_MIX)}.")
+        try:
+            mix[action] = float(weight)
+        except ValueError:
+            raise CommandError(f"The weight of '{action}' must be a number.")
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the traffic of 'main.js' (page loads, posts' pages with their comments chunks, likes/dislikes "
+        "with their likes count, likes lists) against a running server with concurrent virtual users, "
+        "and report the throughput and the tail latency of each endpoint. The users log in as '<prefix><number>' "
+        "(e.g. the users of 'generate_data')."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="The server to load.")
+        parser.add_argument("--users", type=int, default=10, help="How many virtual users at once.")
+        parser.add_argument("--duration", type=float, default=30, help="How long to run (in seconds).")
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=1,
+            help="The mean pause between a user's actions (in seconds, 0 to hammer the server).",
+        )
+        parser.add_argument("--ramp-up", type=float, default=2, help="Start the users over this time (in seconds).")
+        parser.add_argument("--timeout", type=float, default=30, help="A request's timeout (in seconds).")
+        parser.add_argument("--username-prefix", default="synthetic-")
+        parser.add_argument("--password", default="benchmark")
+        parser.add_argument(
+            "--mix",
+            nargs="*",
+            default=[],
+            metavar="ACTION=WEIGHT",
+            help=f"Change the actions' weights (the defaults: {' '.join(f'{a}={w}' for a, w in DEFAULT_MIX.items())}).",
+        )
+        parser.add_argument("--output", help="Save the results as JSON to this file too.")
+
+    def handle(self, *args, **options):
+        options["mix"] = parse_mix(options["mix"])
+        summary = asyncio.run(run_load_test(options))
+        self.stdout.write(
+            f"{options['users']} users for {summary['duration']:.1f}s "
+            f"(think time {options['think_time']}s), latencies in ms:"
+        )
+        self.stdout.write(
+            f"{'endpoint':>12} {'requests':>9} {'errors':>7} {'req/s':>8} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+        )
+        for endpoint, result in summary["endpoints"].items():
+            self.stdout.write(
+                f"{endpoint:>12} {result['requests']:>9} {result['errors']:>7} {result['throughput']:>8.1f} "
+                + " ".join(f"{result[key] * 1000:>8.1f}" for key in ("p50", "p95", "p99", "max"))
+            )
+        total = sum(result["requests"] for result in summary["endpoints"].values())
+        self.stdout.write(self.style.SUCCESS(f"{total / summary['duration']:.1f} requests/s in total."))
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({"options": {k: options[k] for k in ("url", "users", "duration", "think_time", "mix")},
+                           **summary}, output, indent=2)
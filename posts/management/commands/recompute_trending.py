@@ -0,0 +1,32 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Decay the posts' trending scores to their current age, and drop the posts older than "
+        "'POSTS_TRENDING_WINDOW_HOURS' out of the ranking. Run it every 'POSTS_TRENDING_INTERVAL' seconds "
+        "(e.g. from cron), or keep it running with '--forever'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--forever",
+            action="store_true",
+            help="Recompute the scores again every 'POSTS_TRENDING_INTERVAL' seconds, until interrupted.",
+        )
+
+    def handle(self, *args, **options):
+        interval = getattr(settings, "POSTS_TRENDING_INTERVAL", 300)
+        while True:
+            start = time.perf_counter()
+            recomputed = Post.objects.recompute_trending()
+            self.stdout.write(self.style.SUCCESS(
+                f"Recomputed the trending scores of {recomputed} post(s) "
+                f"in {(time.perf_counter() - start) * 1000:.1f} ms."
+            ))
+            if not options["forever"]:
+                return
+            time.sleep(max(0, interval - (time.perf_counter() - start)))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post, UserStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-derive the stored likes/comments counters of the posts, and the stats of their owners "
+        "(to repair any drift)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "post_ids",
+            nargs="*",
+            type=int,
+            help="Only recount these posts (all posts by default).",
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if options["post_ids"]:
+            posts = posts.filter(pk__in=options["post_ids"])
+        recounted = posts.recount()
+        UserStats.objects.refresh(posts.values_list("owner", flat=True).distinct())
+        self.stdout.write(self.style.SUCCESS(f"Recounted the likes and comments of {recounted} post(s)."))
@@ -0,0 +1,185 @@
+import logging
+import math
+import threading
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from . import routers
+
+logger = logging.getLogger("posts.queries")
+
+# Not counted as queries (e.g. the 'BEGIN IMMEDIATE' of the writing transactions), a request doesn't choose them
+TRANSACTION_STATEMENTS = ("BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+# The totals of the requests this process served
+_query_totals = {"requests": 0, "queries": 0, "dbTimeMs": 0.0, "overBudget": 0}
+_query_totals_lock = threading.Lock()
+
+
+def query_stats():
+    with _query_totals_lock:
+        totals = dict(_query_totals)
+    totals["queriesPerRequest"] = totals["queries"] / totals["requests"] if totals["requests"] else 0
+    return totals
+
+
+class RequestQueries:
+    """
+    An execute wrapper (see 'connection.execute_wrapper()') that times every query of a request,
+    the transaction control statements are timed but not counted.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = ""
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+                self.count += 1
+            self.time += duration
+            if duration >= self.slowest_time:
+                self.slowest_time = duration
+                self.slowest_sql = sql
+
+
+class QueryStatsMiddleware:
+    """
+    Count and time the SQL queries of each request, add them to the response's 'Server-Timing' header
+    (as 'db', next to the whole request as 'app') and log them, with a warning for the requests that make
+    more than 'POSTS_QUERY_BUDGET' queries (and thus, probably, a query per object).
+    It must come first in the 'MIDDLEWARE', to count the session and the user queries too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # Stay async under ASGI, not to take a thread per request
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = RequestQueries()
+        request.queries = queries
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.wrap_connections(stack, queries)
+            response = self.get_response(request)
+        self.finish(request, response, queries, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        queries = RequestQueries()
+        request.queries = queries
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            # The connections are per thread, so they are wrapped in the thread that runs the request's queries
+            await sync_to_async(self.wrap_connections)(stack, queries)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        self.finish(request, response, queries, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def wrap_connections(stack, queries):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+
+    def finish(self, request, response, queries, duration):
+        response["Server-Timing"] = (
+            f'db;dur={queries.time * 1000:.2f};desc="{queries.count} queries", '
+            f"app;dur={duration * 1000:.2f}"
+        )
+        self.record(request, response, queries, duration)
+
+    def record(self, request, response, queries, duration):
+        over_budget = queries.count > getattr(settings, "POSTS_QUERY_BUDGET", 10)
+        with _query_totals_lock:
+            _query_totals["requests"] += 1
+            _query_totals["queries"] += queries.count
+            _query_totals["dbTimeMs"] += queries.time * 1000
+            _query_totals["overBudget"] += over_budget
+        fields = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": queries.count,
+            "db_ms": round(queries.time * 1000, 2),
+            "total_ms": round(duration * 1000, 2),
+            "slowest_ms": round(queries.slowest_time * 1000, 2),
+            "slowest_sql": queries.slowest_sql[:200],
+        }
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            " ".join(f"{name}={value!r}" if name == "slowest_sql" else f"{name}={value}"
+                     for name, value in fields.items()),
+            extra={"request_queries": fields},
+        )
+
+
+class ReplicaMiddleware:
+    """
+    Send the reads of the read-only views to the replicas (see 'posts/routers.py'),
+    and pin the session to the primary database for a while once it wrote.
+    It must come before the sessions' middleware, to see the sessions' writes (e.g. logging in).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing, token = routers.start_request(request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        self.finish(routing, response)
+        return response
+
+    async def __acall__(self, request):
+        routing, token = routers.start_request(request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        self.finish(routing, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routers.read_from_replicas(request, view_func)
+
+    @staticmethod
+    def finish(routing, response):
+        if routing.wrote and routers.replica_aliases():
+            seconds = getattr(settings, "POSTS_REPLICA_STICKY_SECONDS", 5)
+            response.set_cookie(
+                routers.STICKY_COOKIE,
+                f"{time.time() + seconds:.3f}",
+                max_age=math.ceil(seconds),
+                httponly=True,
+                samesite="Lax",
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
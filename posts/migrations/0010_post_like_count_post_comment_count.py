@@ -0,0 +1,42 @@
+# Generated by Django 4.2.4 on 2026-10-18 14:54
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_likes_and_comments(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+
+    def count_per_post(model):
+        return Coalesce(Subquery(
+            model.objects.filter(post=OuterRef("pk")).order_by()
+            .values("post").annotate(count=Count("pk")).values("count"),
+            output_field=IntegerField(),
+        ), 0)
+
+    Post.objects.update(
+        like_count=count_per_post(apps.get_model("posts", "Like")),
+        comment_count=count_per_post(apps.get_model("posts", "Comment")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_alter_like_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_likes_and_comments, migrations.RunPython.noop),
+    ]
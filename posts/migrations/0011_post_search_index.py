@@ -0,0 +1,71 @@
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+# The index as it was made by this migration (the search code may change it since, see 'posts/search.py'):
+# an external content FTS5 table, that only stores the index and reads the text from 'posts_post'
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5("
+    "title, text, content='posts_post', content_rowid='id')"
+)
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_update AFTER UPDATE OF title, text ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO posts_post_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+]
+REBUILD = "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')"
+DROP = [
+    "DROP TRIGGER IF EXISTS posts_post_fts_insert",
+    "DROP TRIGGER IF EXISTS posts_post_fts_delete",
+    "DROP TRIGGER IF EXISTS posts_post_fts_update",
+    "DROP TABLE IF EXISTS posts_post_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """ Create the FTS5 index of the posts (on SQLite only) and fill it with the existing posts """
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=connection.alias):
+                cursor.execute(CREATE_TABLE)
+        except OperationalError:
+            # SQLite was built without FTS5, the search falls back to the other backends
+            return
+        for sql in CREATE_TRIGGERS:
+            cursor.execute(sql)
+        cursor.execute(REBUILD)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for sql in DROP:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_like_count_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
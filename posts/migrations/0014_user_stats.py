@@ -0,0 +1,50 @@
+# Generated by Django 4.2.4 on 2026-10-18 15:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def compute_existing_user_stats(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    Post = apps.get_model("posts", "Post")
+    UserStats = apps.get_model("posts", "UserStats")
+
+    def per_owner(aggregate):
+        return Subquery(
+            Post.objects.filter(owner=OuterRef("user")).order_by()
+            .values("owner").annotate(value=aggregate).values("value")
+        )
+
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in User.objects.values_list("pk", flat=True)], batch_size=500)
+    UserStats.objects.update(
+        post_count=Coalesce(per_owner(Count("pk")), 0),
+        likes_received=Coalesce(per_owner(Sum("like_count")), 0),
+        comments_received=Coalesce(per_owner(Sum("comment_count")), 0),
+        last_post_at=per_owner(Max("created_at")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('posts', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('post_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('likes_received', models.PositiveIntegerField(default=0, editable=False)),
+                ('comments_received', models.PositiveIntegerField(default=0, editable=False)),
+                ('last_post_at', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+        ),
+        migrations.RunPython(compute_existing_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.4 on 2026-10-18 15:53
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import posts.models
+
+
+def score_existing_posts(apps, schema_editor):
+    """ The trending scores of the posts as of now (frozen here, not through the models' code that may change) """
+    Post = apps.get_model("posts", "Post")
+    now = timezone.now()
+    gravity = getattr(settings, "POSTS_TRENDING_GRAVITY", 1.8)
+    comment_weight = getattr(settings, "POSTS_TRENDING_COMMENT_WEIGHT", 1)
+    cutoff = now - timedelta(hours=getattr(settings, "POSTS_TRENDING_WINDOW_HOURS", 48))
+    # The ones out of the trending window get none
+    Post.objects.filter(created_at__lt=cutoff).update(trending_decay=0, trending_score=0)
+    # The others (a couple of days of posts) by their age, computed here instead of in each database's SQL
+    trending = list(Post.objects.filter(created_at__gte=cutoff).only("created_at", "like_count", "comment_count"))
+    for post in trending:
+        age_hours = max((now - post.created_at).total_seconds() / 3600, 0)
+        post.trending_decay = 1 / (age_hours + 2) ** gravity
+        post.trending_score = (post.like_count + post.comment_count * comment_weight) * post.trending_decay
+    Post.objects.bulk_update(trending, ["trending_decay", "trending_score"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_user_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_decay',
+            field=models.FloatField(default=posts.models.decay_after, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('trending_score__gt', 0)), fields=['-trending_score', '-id'], name='posts_post_trending_idx'),
+        ),
+        migrations.RunPython(score_existing_posts, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,135 @@
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import NotSupportedError, models
+from django.db.models import (
+    Count, DateTimeField, Exists, ExpressionWrapper, F, FloatField, Func, IntegerField, Max, OuterRef, Subquery, Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Power
+from django.utils import timezone
 from django.core.validators import MinLengthValidator, MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
 
 # Create your models here.
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self, user):
+        """
+        Get everything a post card needs with the posts themselves in one query
+        (whether 'user' liked each post, and the owner with the owner's picture),
+        the likes/comments counts are already stored on the post.
+        """
+        return self.select_related("owner", "owner__user_picture").annotate(liked_by_user=liked_by(user))
+
+    def recount(self):
+        """ Re-derive the stored likes/comments counters (and trending scores) from the 'Like' and 'Comment' tables. """
+        updated = self.update(
+            like_count=_count_per_post(Like),
+            comment_count=_count_per_post(Comment),
+        )
+        self.update(trending_score=trending_score())
+        return updated
+
+    def recompute_trending(self, now=None):
+        """
+        Decay the posts' trending scores to 'now', and drop the posts older than 'POSTS_TRENDING_WINDOW_HOURS'
+        out of the ranking, in two UPDATEs. In between, the likes/comments change the scores with the decay of the
+        last time (see 'signals.py'), the posts are ranked by their age then and their likes/comments now.
+        """
+        now = now or timezone.now()
+        cutoff = now - timedelta(hours=getattr(settings, "POSTS_TRENDING_WINDOW_HOURS", 48))
+        decay = ExpressionWrapper(
+            1.0 / Power(Greatest(HoursBefore("created_at", now), 0.0) + 2, _gravity()),
+            output_field=FloatField(),
+        )
+        updated = self.filter(created_at__gte=cutoff).update(
+            trending_decay=decay,
+            trending_score=trending_score(decay=decay),
+        )
+        # Through the trending index, an older post that nobody liked keeps its decay until it is liked,
+        # then it is at the bottom of the ranking until the next time
+        self.filter(created_at__lt=cutoff, trending_score__gt=0).update(trending_decay=0, trending_score=0)
+        return updated
+
+
+def liked_by(user):
+    """ Whether 'user' liked the post, as an expression to annotate the posts with """
+    if not user.is_authenticated:
+        return Value(False)
+    return Exists(Like.objects.filter(post=OuterRef("pk"), owner=user))
+
+
+def _gravity():
+    return getattr(settings, "POSTS_TRENDING_GRAVITY", 1.8)
+
+
+def decay_after(age_hours=0):
+    """ How much a like/comment counts towards a post's trending score 'age_hours' after it was posted """
+    return 1 / (max(age_hours, 0) + 2) ** _gravity()
+
+
+def trending_score(like_count=F("like_count"), comment_count=F("comment_count"), decay=F("trending_decay")):
+    """ The trending score as an expression, of the post's own columns unless given others """
+    points = like_count + comment_count * getattr(settings, "POSTS_TRENDING_COMMENT_WEIGHT", 1)
+    return ExpressionWrapper(points * decay, output_field=FloatField())
+
+
+class HoursBefore(Func):
+    """ How many hours the datetime is before 'now', as a float (on SQLite, PostgreSQL and MySQL) """
+    output_field = FloatField()
+
+    def __init__(self, expression, now):
+        super().__init__(Value(now, output_field=DateTimeField()), expression)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"HoursBefore() isn't implemented for {connection.vendor}.")
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite stores the datetimes as text, that 'julianday()' turns into (fractional) days
+        return super().as_sql(
+            compiler,
+            connection,
+            template="(julianday(%(expressions)s)) * 24",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template="EXTRACT(EPOCH FROM (%(expressions)s)) / 3600",
+            arg_joiner=" - ",
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        # 'TIMESTAMPDIFF()' is the second datetime minus the first one (here the datetime minus 'now')
+        return super().as_sql(
+            compiler,
+            connection,
+            template="-TIMESTAMPDIFF(MICROSECOND, %(expressions)s) / 3600000000",
+            **extra_context,
+        )
+
+
+def _count_per_post(model):
+    """ A correlated subquery that counts the 'model' rows of the outer post (without joining the tables). """
+    return Coalesce(
+        Subquery(
+            model.objects
+            .filter(post=OuterRef("pk"))
+            .order_by()
+            .values("post")
+            .annotate(count=Count("pk"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
 class Post(models.Model):
     title = models.CharField(
         default="Untitled Post",
@@ -30,9 +155,41 @@ class Post(models.Model):
         through="Like",
         related_name="liked_posts"
     )
+    # Denormalized counters, kept in sync with the 'Like' and 'Comment' tables by 'signals.py'
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Whether the post was pushed into its owner's followers' feeds (see 'feed.py'),
+    # otherwise the feeds pull it when they are read (the owner has too many followers)
+    fanned_out = models.BooleanField(default=True, editable=False)
+    # The trending score, (likes + comments) * decay, kept up to date with the counters by 'signals.py',
+    # the decay is re-computed from the post's age by 'recompute_trending()' (0 once it is out of the trending window)
+    trending_score = models.FloatField(default=0, editable=False)
+    trending_decay = models.FloatField(default=decay_after, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # The posts are walked by ('created_at', 'id') (see 'pagination.py'), all of them or a user's ones
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="posts_post_created_idx"),
+            models.Index(fields=["owner", "-created_at", "-id"], name="posts_post_owner_created_idx"),
+            models.Index(
+                fields=["owner", "-created_at"],
+                condition=models.Q(fanned_out=False),
+                name="posts_post_pulled_idx",
+            ),
+            # The posts saved since the "memory" search backend's index was (see 'search.py')
+            models.Index(fields=["updated_at"], name="posts_post_updated_idx"),
+            # The trending posts, the best first (only the ones in the ranking)
+            models.Index(
+                fields=["-trending_score", "-id"],
+                condition=models.Q(trending_score__gt=0),
+                name="posts_post_trending_idx",
+            ),
+        ]
+
     def get_owner_pic(self):
         return UserPicture.objects.get(user=self.owner).picture_path
 
@@ -50,6 +207,12 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # A post's comments are walked oldest first
+        indexes = [
+            models.Index(fields=["post", "created_at", "id"], name="posts_comment_post_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.owner.username}, commented on '{self.post}'"
 
@@ -63,11 +226,65 @@ class Like(models.Model):
     # https://docs.djangoproject.com/en/4.0/ref/models/options/#unique-together
     class Meta:
         unique_together = ("post", "owner")
+        # A post's likes are walked oldest first
+        indexes = [
+            models.Index(fields=["post", "created_at", "id"], name="posts_like_post_created_idx"),
+        ]
 
     def __str__(self):
         return self.owner.username + ", liked '" + self.post.title + "'"
 
 
+class Follow(models.Model):
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
+    followed = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("follower", "followed")
+
+    def __str__(self):
+        return f"{self.follower.username} follows {self.followed.username}"
+
+
+class FeedEntry(models.Model):
+    """ A post pushed into a user's feed, the feed is read by a range scan of its owner's entries """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="feed_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    # A copy of the post's 'created_at', so the feed is ordered without joining the posts
+    post_created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("owner", "post")
+        indexes = [
+            models.Index(
+                fields=["owner", "-post_created_at", "-post"],
+                name="posts_feed_owner_created_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"'{self.post}' in {self.owner.username}'s feed"
+
+
+class PostSearchEntry(models.Model):
+    """
+    A post's row in the SQLite FTS5 index (created and kept up to date by 'search.py', not by the migrations),
+    only here to join the posts with the index.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_entry",
+    )
+
+    class Meta:
+        managed = False
+        db_table = "posts_post_fts"
+
+
 class UserPicture(models.Model):
     picture_path = models.IntegerField(
         default=1,
@@ -86,3 +303,50 @@ class UserPicture(models.Model):
 
     def __str__(self):
         return f"The picture's path for '{self.user.username}' is: {self.picture_path}"
+
+
+class UserStatsQuerySet(models.QuerySet):
+    def refresh(self, user_ids):
+        """ Re-derive the users' stats from their posts (making the missing ones), an INSERT and an UPDATE per batch """
+        user_ids = list(user_ids)
+        updated = 0
+        for start in range(0, len(user_ids), 500):
+            batch = user_ids[start:start + 500]
+            self.bulk_create([UserStats(user_id=pk) for pk in batch], ignore_conflicts=True)
+            updated += self.filter(user__in=batch).update(
+                post_count=Coalesce(_aggregate_per_owner(Count("pk")), 0),
+                likes_received=Coalesce(_aggregate_per_owner(Sum("like_count")), 0),
+                comments_received=Coalesce(_aggregate_per_owner(Sum("comment_count")), 0),
+                last_post_at=_aggregate_per_owner(Max("created_at")),
+            )
+        return updated
+
+
+def _aggregate_per_owner(aggregate):
+    """ A correlated subquery of the 'aggregate' of the outer user's posts (a range of the owner's posts index) """
+    return Subquery(
+        Post.objects
+        .filter(owner=OuterRef("user"))
+        .order_by()
+        .values("owner")
+        .annotate(value=aggregate)
+        .values("value")
+    )
+
+
+class UserStats(models.Model):
+    """
+    A user's numbers for the profile's header, kept up to date by the signals (see 'signals.py'),
+    instead of counting (and summing) the user's posts on every visit.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    # The likes/comments of the user's posts
+    likes_received = models.PositiveIntegerField(default=0, editable=False)
+    comments_received = models.PositiveIntegerField(default=0, editable=False)
+    last_post_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = UserStatsQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user.username}'s stats: {self.post_count} post(s)"
@@ -0,0 +1,200 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+class CursorPage:
+    """
+    A page of objects that knows the cursors of its neighbours instead of their numbers,
+    it mimics the parts of django's 'Page' that the templates use.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator ordered by ('key', 'pk'), every page is a single indexed range query
+    (no 'COUNT(*)' and no 'OFFSET'), so the last page costs the same as the first one.
+    The cursors are opaque url-safe tokens pointing to the edge object of a page.
+    """
+
+    NEXT = "n"
+    PREVIOUS = "p"
+
+    def __init__(self, object_list, per_page, key="created_at", descending=True, parse=datetime.fromisoformat):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.key = key
+        self.descending = descending
+        self.parse = parse  # Turns the key's value back from its string in the cursor
+
+    def encode_cursor(self, obj, direction):
+        value = getattr(obj, self.key)
+        value = value.isoformat() if hasattr(value, "isoformat") else repr(value)
+        raw = f"{direction}|{value}|{obj.pk}"
+        return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """ Return (direction, key value, pk) or 'None' if the cursor is not a valid one """
+        try:
+            raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            direction, value, pk = raw.split("|")
+            if direction not in (self.NEXT, self.PREVIOUS):
+                return None
+            return direction, self.parse(value), int(pk)
+        except (Base64Error, UnicodeDecodeError, ValueError, TypeError):
+            return None
+
+    def _ordering(self, forward):
+        descending = self.descending if forward else not self.descending
+        prefix = "-" if descending else ""
+        return (prefix + self.key, prefix + "pk")
+
+    def _after(self, value, pk, forward):
+        """ The objects that come after (value, pk) when walking in the given direction """
+        descending = self.descending if forward else not self.descending
+        lookup = "lt" if descending else "gt"
+        return (
+            Q(**{f"{self.key}__{lookup}": value})
+            | Q(**{self.key: value, f"pk__{lookup}": pk})
+        )
+
+    def _page_queryset(self, cursor):
+        """ Return the queryset of the page the cursor points to, whether it walks forward and whether it has a cursor """
+        decoded = self.decode_cursor(cursor) if cursor else None
+        forward = decoded is None or decoded[0] == self.NEXT
+        queryset = self.object_list.order_by(*self._ordering(forward))
+        if decoded is not None:
+            queryset = queryset.filter(self._after(decoded[1], decoded[2], forward))
+        # Fetch one extra object to know whether there is more in this direction
+        return queryset[:self.per_page + 1], forward, decoded is not None
+
+    def get_page(self, cursor=None):
+        """ Return the page the cursor points to (or the first page if the cursor is missing or invalid) """
+        queryset, forward, through_cursor = self._page_queryset(cursor)
+        return self._page(list(queryset), forward, through_cursor)
+
+    async def aget_page(self, cursor=None):
+        """ 'get_page()' for the async views """
+        queryset, forward, through_cursor = self._page_queryset(cursor)
+        return self._page([obj async for obj in queryset], forward, through_cursor)
+
+    def page_from_ids(self, ids):
+        """
+        Make a (forward) page out of the ids of its objects, in order (with one more id if there is a next page),
+        e.g. from a precomputed list of ids, fetching the objects in one 'IN' query.
+        """
+        objects_by_id = self.object_list.in_bulk(ids)
+        return self._page([objects_by_id[pk] for pk in ids if pk in objects_by_id], True, False)
+
+    def _page(self, objects, forward, through_cursor):
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if not forward:
+            objects.reverse()
+        # Coming through a cursor means there is something on the other side of it
+        has_next = has_more if forward else True
+        has_previous = through_cursor if forward else has_more
+        return CursorPage(
+            objects,
+            self,
+            next_cursor=(
+                self.encode_cursor(objects[-1], self.NEXT)
+                if objects and has_next else None
+            ),
+            previous_cursor=(
+                self.encode_cursor(objects[0], self.PREVIOUS)
+                if objects and has_previous else None
+            ),
+        )
+
+
+def paginate_posts(request, post_list, per_page, count=None, **cursor_options):
+    """
+    Paginate the posts by the request's '?cursor=',
+    or by the old '?page=' number (with 'COUNT(*)', unless the 'count' is known, and 'OFFSET')
+    to keep the old links working.
+    """
+    page_number = request.GET.get("page", False)
+    if page_number and not request.GET.get("cursor"):
+        paginator = Paginator(post_list, per_page, allow_empty_first_page=True)
+        if count is not None:
+            # Instead of the paginator's own 'COUNT(*)'
+            paginator.count = count
+        return paginator, paginator.get_page(page_number)
+    paginator = CursorPaginator(post_list, per_page, **cursor_options)
+    return paginator, paginator.get_page(request.GET.get("cursor"))
+
+
+def _chunk_paginator(request, object_list, per_page, max_per_page):
+    """ The 'apaginate_chunk()' paginator, Django's one for the old '?page=' numbers """
+    page_number = request.GET.get("page", False)
+    if page_number and not request.GET.get("after"):
+        return Paginator(object_list, per_page, allow_empty_first_page=True)
+    try:
+        limit = int(request.GET.get("limit", per_page))
+    except ValueError:
+        limit = per_page
+    return CursorPaginator(object_list, min(max(limit, 1), max_per_page), descending=False)
+
+
+async def apaginate_chunk(request, object_list, per_page, max_per_page):
+    """
+    Paginate a JSON endpoint's objects (oldest first) by the request's '?after=' cursor,
+    taking a '?limit=' of them (capped by 'max_per_page'),
+    or by the old '?page=' number, 'per_page' objects at a time.
+    """
+    paginator = _chunk_paginator(request, object_list, per_page, max_per_page)
+    if isinstance(paginator, CursorPaginator):
+        return paginator, await paginator.aget_page(request.GET.get("after"))
+
+    # Django's paginator has no async interface (it is only for the old links anyway)
+    def get_page():
+        page = paginator.get_page(request.GET.get("page"))
+        page.object_list = list(page.object_list)
+        return page
+    return paginator, await sync_to_async(get_page)()
+
+
+def chunk_variant(request, per_page, max_per_page):
+    """
+    Which chunk 'apaginate_chunk()' returns for the request, normalized (e.g. for a cache key):
+    the query's values can be anything, an invalid cursor, page or limit is the same as what it falls back to.
+    """
+    paginator = _chunk_paginator(request, None, per_page, max_per_page)
+    if isinstance(paginator, CursorPaginator):
+        cursor = paginator.decode_cursor(request.GET.get("after", ""))
+        after = "first" if cursor is None else f"{cursor[0]}:{cursor[1].isoformat()}:{cursor[2]}"
+        return f"after={after}&limit={paginator.per_page}"
+    # As Django's 'get_page()': not a number is the first page, below 1 the last one
+    try:
+        page = int(request.GET["page"])
+    except ValueError:
+        page = 1
+    return f"page={page if page >= 1 else 'last'}"
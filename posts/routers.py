@@ -0,0 +1,73 @@
+"""
+Read replicas: the read-only views (the ones with 'read_from_replica = True') read from one of
+'POSTS_READ_REPLICAS' (database aliases), everything else, and every write, goes to "default".
+A session that wrote is pinned to "default" for 'POSTS_REPLICA_STICKY_SECONDS' (through a cookie, set by
+'ReplicaMiddleware'), to see its own new posts/comments/likes before they reach the replicas.
+"""
+
+import random
+import time
+from contextvars import ContextVar
+from django.conf import settings
+
+STICKY_COOKIE = "primary_until"
+
+
+class RequestRouting:
+    """ How the current request reads, and whether it wrote """
+
+    def __init__(self, sticky=False):
+        self.sticky = sticky
+        self.replicas = False
+        self.wrote = False
+
+
+_routing = ContextVar("posts_request_routing", default=None)
+
+
+def replica_aliases():
+    return getattr(settings, "POSTS_READ_REPLICAS", [])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        replicas = replica_aliases()
+        if routing is None or not routing.replicas or routing.sticky or routing.wrote or not replicas:
+            return "default"
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas are copies of "default", the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get their tables by copying (or replicating) "default"
+        return db not in replica_aliases()
+
+
+def start_request(cookies):
+    """ Start routing a request, pinned to "default" if its session wrote lately """
+    try:
+        sticky = float(cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        sticky = False
+    routing = RequestRouting(sticky)
+    return routing, _routing.set(routing)
+
+
+def end_request(token):
+    _routing.reset(token)
+
+
+def read_from_replicas(request, view_func):
+    """ Let the rest of the request read from the replicas, if it goes to a read-only view """
+    routing = _routing.get()
+    if routing is not None and request.method in ("GET", "HEAD"):
+        routing.replicas = getattr(getattr(view_func, "view_class", None), "read_from_replica", False)
@@ -0,0 +1,231 @@
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.db.utils import OperationalError
+from .inverted_index import InvertedIndex
+from .models import Post, PostSearchEntry
+
+# An external content FTS5 table, it only stores the index and reads the text from 'posts_post'
+FTS_TABLE = PostSearchEntry._meta.db_table
+
+FTS_TRIGGERS = {
+    f"{FTS_TABLE}_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+        END
+    """,
+    f"{FTS_TABLE}_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        END
+    """,
+    f"{FTS_TABLE}_update": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, text ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+        END
+    """,
+}
+
+# Whether each database has the index, by (alias, name), so it is only looked up once
+_fts_available = {}
+
+
+def _database_key(connection):
+    return (connection.alias, str(connection.settings_dict["NAME"]))
+
+
+def install_fts_index(connection):
+    """
+    Create the FTS5 index of the posts and its triggers if they are missing
+    (SQLite drops the triggers whenever a migration remakes the 'posts_post' table),
+    and rebuild the index from the posts if anything was missing.
+    Return whether the database has the index (it is SQLite with FTS5).
+    """
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        names = [FTS_TABLE, *FTS_TRIGGERS]
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s)" % ", ".join(["%s"] * len(names)),
+            names,
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            try:
+                with transaction.atomic(using=connection.alias):
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                        "title, text, content='posts_post', content_rowid='id')"
+                    )
+            except OperationalError:
+                # SQLite was built without FTS5
+                _fts_available[_database_key(connection)] = False
+                return False
+        for sql in FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        if not existing.issuperset(names):
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_available[_database_key(connection)] = True
+    return True
+
+
+def uninstall_fts_index(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name in FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _fts_available.pop(_database_key(connection), None)
+
+
+def fts_index_available(connection):
+    key = _database_key(connection)
+    if key not in _fts_available:
+        _fts_available[key] = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[key]
+
+
+def build_match_query(query, prefix=True):
+    """
+    Turn the user's query into an FTS5 query that matches the posts having all of its words
+    (or words starting with them if 'prefix'), or 'None' if the query has no words.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' + ("*" if prefix else "") for word in words)
+
+
+def search_posts_fts(queryset, query, prefix=True):
+    """
+    Filter the posts by the FTS5 index and annotate them with their 'search_rank' (bm25, lower is better),
+    or return 'None' if the index can't be used (not SQLite, no FTS5 or no words in the query).
+    """
+    match = build_match_query(query, prefix)
+    if match is None or not fts_index_available(connections[queryset.db]):
+        return None
+    return (
+        queryset
+        # Join the index (a correlated 'MATCH' per post would run the full-text query once per matching post)
+        .filter(search_entry__isnull=False)
+        .filter(RawSQL(f"{FTS_TABLE} MATCH %s", (match,), output_field=BooleanField()))
+        # Matches in the title weigh twice as much as matches in the text
+        .annotate(search_rank=RawSQL(f"bm25({FTS_TABLE}, 2.0, 1.0)", ()))
+        .order_by("search_rank", "pk")
+    )
+
+
+# The process's inverted index of the posts (for the "memory" search backend), loaded on first use,
+# then brought up to date with the posts saved by the other processes every 'POSTS_SEARCH_SYNC_INTERVAL' seconds
+_inverted_index = None
+_inverted_index_lock = threading.Lock()
+_inverted_index_synced_at = 0
+
+
+def index_posts(index, posts):
+    """
+    Add the posts to the index, and move its 'synced_until' mark (the ISO 'updated_at' of the newest post
+    it has, as it is saved with the index) up to theirs.
+    """
+    newest = datetime.fromisoformat(index.synced_until) if index.synced_until else None
+    for pk, title, text, updated_at in posts.values_list("pk", "title", "text", "updated_at").iterator():
+        index.add(pk, f"{title} {text}")
+        if newest is None or updated_at > newest:
+            newest = updated_at
+    if newest is not None:
+        index.synced_until = newest.isoformat()
+
+
+def build_inverted_index():
+    index = InvertedIndex()
+    index_posts(index, Post.objects.order_by("pk"))
+    return index
+
+
+def sync_inverted_index(index):
+    """ Index the posts saved (created or edited) after its 'synced_until' mark, e.g. since its file was saved """
+    posts = Post.objects.order_by("updated_at")
+    if index.synced_until:
+        posts = posts.filter(updated_at__gt=datetime.fromisoformat(index.synced_until))
+    index_posts(index, posts)
+
+
+def get_inverted_index():
+    """
+    Memory-map the index from 'POSTS_SEARCH_INDEX_PATH' if it was saved there
+    (by the 'build_search_index' command) and index the posts saved since, or build it from the database.
+    """
+    global _inverted_index, _inverted_index_synced_at
+    with _inverted_index_lock:
+        if _inverted_index is None:
+            path = getattr(settings, "POSTS_SEARCH_INDEX_PATH", None)
+            index = None
+            if path and os.path.exists(path):
+                try:
+                    index = InvertedIndex.load(path)
+                except ValueError:
+                    # Saved in an older format, rebuild it until the file is saved again
+                    pass
+            _inverted_index = index or build_inverted_index()
+            _inverted_index_synced_at = 0
+        if time.monotonic() - _inverted_index_synced_at >= getattr(settings, "POSTS_SEARCH_SYNC_INTERVAL", 5):
+            sync_inverted_index(_inverted_index)
+            _inverted_index_synced_at = time.monotonic()
+    return _inverted_index
+
+
+def update_inverted_index(post, deleted=False):
+    """
+    Apply a saved/deleted post to this process's inverted index once the change is committed
+    (the other processes index the saved posts on their next sync, and leave the deleted ones out of the results
+    because they are not in the database anymore).
+    """
+    index = _inverted_index
+    if index is None:
+        # It will be built with the change anyway
+        return
+    # Take the values now ('delete()' clears the post's pk)
+    pk, text = post.pk, f"{post.title} {post.text}"
+    if deleted:
+        transaction.on_commit(lambda: index.remove(pk))
+    else:
+        transaction.on_commit(lambda: index.add(pk, text))
+
+
+def search_posts(queryset, query):
+    """
+    Find the posts matching the query with the backend chosen by 'POSTS_SEARCH_BACKEND',
+    return them with the cursor pagination options that keep their order:
+      - "fts5": the SQLite full-text index, best matches first (like "database" on other databases).
+      - "memory": this process's inverted index, newest first.
+      - "database": 'LIKE' queries over the title and text, newest first.
+    """
+    backend = getattr(settings, "POSTS_SEARCH_BACKEND", "fts5")
+    prefix = getattr(settings, "POSTS_SEARCH_PREFIX", True)
+    if backend == "fts5":
+        post_list = search_posts_fts(queryset, query, prefix)
+        if post_list is not None:
+            return post_list, {"key": "search_rank", "descending": False, "parse": float}
+    elif backend == "memory":
+        ids = get_inverted_index().search(
+            query, prefix, limit=getattr(settings, "POSTS_SEARCH_MAX_RESULTS", 1000))
+        return queryset.filter(pk__in=ids).order_by("-created_at"), {}
+    elif backend != "database":
+        raise ImproperlyConfigured(
+            f"Unknown POSTS_SEARCH_BACKEND '{backend}', use 'fts5', 'memory' or 'database'.")
+    post_list = queryset.filter(
+        Q(title__icontains=query) | Q(text__icontains=query)
+    ).order_by("-created_at")
+    return post_list, {}
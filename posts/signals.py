@@ -0,0 +1,137 @@
+from django.db import connections
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from .cache import LIKES, COMMENTS, invalidate
+from .models import Post, Comment, Like, User, UserPicture, UserStats, trending_score
+from .auth import invalidate_user
+from .search import install_fts_index, update_inverted_index
+from .events import publish_counts
+from .sqlite import apply_pragmas
+from .backends.sqlite3.base import record_reuse
+from . import feed, timeline
+
+
+def update_counter(post_id, field, step):
+    """
+    Add 'step' to the post's 'field' counter in the database (using 'F()' to avoid lost updates),
+    and re-score it for the trending posts with the new count in the same UPDATE.
+    """
+    posts = Post.objects.filter(pk=post_id)
+    if step < 0:
+        # Never go below zero, even if the counter drifted
+        posts = posts.filter(**{field + "__gte": -step})
+    posts.update(**{field: F(field) + step, "trending_score": trending_score(**{field: F(field) + step})})
+
+
+def update_owner_stats(post_id, field, step):
+    """ Add 'step' to the 'field' of the post's owner's stats (finding the owner in the same UPDATE). """
+    stats = UserStats.objects.filter(user=Subquery(Post.objects.filter(pk=post_id).values("owner")[:1]))
+    if step < 0:
+        stats = stats.filter(**{field + "__gte": -step})
+    stats.update(**{field: F(field) + step})
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        update_counter(instance.post_id, "like_count", 1)
+        update_owner_stats(instance.post_id, "likes_received", 1)
+        invalidate(LIKES, instance.post_id)
+        publish_counts(instance.post_id, "likes", 1)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    update_counter(instance.post_id, "like_count", -1)
+    update_owner_stats(instance.post_id, "likes_received", -1)
+    invalidate(LIKES, instance.post_id)
+    publish_counts(instance.post_id, "likes", -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        update_counter(instance.post_id, "comment_count", 1)
+        update_owner_stats(instance.post_id, "comments_received", 1)
+        invalidate(COMMENTS, instance.post_id)
+        publish_counts(instance.post_id, "comments", 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    update_counter(instance.post_id, "comment_count", -1)
+    update_owner_stats(instance.post_id, "comments_received", -1)
+    invalidate(COMMENTS, instance.post_id)
+    publish_counts(instance.post_id, "comments", -1)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        update_inverted_index(instance)
+        if created:
+            updated = UserStats.objects.filter(user_id=instance.owner_id).update(
+                post_count=F("post_count") + 1,
+                last_post_at=instance.created_at,
+            )
+            if not updated:
+                # No stats yet (e.g. a user added by 'bulk_create()')
+                UserStats.objects.refresh([instance.owner_id])
+            timeline.push_post(instance.pk)
+            feed.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    update_inverted_index(instance, deleted=True)
+    # Its likes and comments were deleted before it, taking themselves off the owner's stats
+    UserStats.objects.filter(user_id=instance.owner_id, post_count__gte=1).update(
+        post_count=F("post_count") - 1,
+        last_post_at=Subquery(
+            Post.objects.filter(owner=OuterRef("user")).order_by("-created_at").values("created_at")[:1]),
+    )
+    timeline.remove_post(instance.pk)
+    # Even a post without likes/comments has its (empty) likes/comments cached
+    invalidate(LIKES, instance.pk)
+    invalidate(COMMENTS, instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, created=False, raw=False, **kwargs):
+    # Also on log in (the 'last_login') and on password changes
+    invalidate_user(instance.pk)
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=UserPicture)
+@receiver(post_delete, sender=UserPicture)
+def user_picture_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    apply_pragmas(connection)
+
+
+@receiver(request_started)
+def count_reused_connections(sender, **kwargs):
+    # After Django's own receiver closed the connections that were too old (or broken)
+    for connection in connections.all(initialized_only=True):
+        record_reuse(connection)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    """ Bring back the search index triggers in case a migration remade the posts table (SQLite drops them) """
+    if sender.name != "posts":
+        return
+    connection = connections[using]
+    if ("posts", "0011_post_search_index") in MigrationRecorder(connection).applied_migrations():
+        install_fts_index(connection)
@@ -0,0 +1,30 @@
+"""
+The SQLite profile ('POSTS_SQLITE_PRAGMAS'), set on every new connection (see 'signals.py').
+With the "production" one the readers don't wait for the writers (the write-ahead log), a commit doesn't wait
+for the disk (only a checkpoint does), a locked database is retried for a while instead of failing at once,
+and the database file is read through memory-mapping with a bigger page cache.
+"""
+
+import re
+from django.conf import settings
+
+PRAGMA_NAME = re.compile(r"^[a-z_]+$")
+
+
+def apply_pragmas(connection):
+    if connection.vendor != "sqlite":
+        return
+    # Straight on the driver's connection, not to count (or log) them as the queries of the request that connected
+    for name, value in getattr(settings, "POSTS_SQLITE_PRAGMAS", {}).items():
+        if not PRAGMA_NAME.match(name) or not re.match(r"^-?\w+$", str(value)):
+            raise ValueError(f"Invalid SQLite pragma: {name} = {value}")
+        connection.connection.execute(f"PRAGMA {name} = {value}").fetchall()
+
+
+def pragmas(connection):
+    """ The current values of the profile's pragmas on the connection """
+    with connection.cursor() as cursor:
+        return {
+            name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in getattr(settings, "POSTS_SQLITE_PRAGMAS", {})
+        }
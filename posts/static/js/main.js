@@ -11,7 +11,12 @@ const serverErrorHTMLMessage = () => {
 
 let rootURLElement = document.getElementById("root-url");
 const ROOT_URL = rootURLElement.innerText;
+const LOGIN_URL = rootURLElement.dataset.loginUrl;
 rootURLElement.remove();
+// How many comments/likes to fetch at once (the server caps them)
+const COMMENTS_CHUNK_SIZE = 5;
+const LIKES_CHUNK_SIZE = 20;
+
 const createNewComment = (commentObject, postID) => {
   return `
     <div class="comment-on-post-${postID} m-3 border round p-2 shadow-sm">
@@ -68,13 +73,16 @@ const postCommentsPopulation = async (postID, commentsLink) => {
     const lessCommentsLinkText = "... Less comments";
     const postMoreCommentsLink = event.target;
     const postCommentsDiv = document.getElementById("post-comments-" + postID);
-    const commentsPageCounter = document.getElementById(
-      "comments-page-counter-" + postID
+    const commentsNextCursor = document.getElementById(
+      "comments-next-cursor-" + postID
     );
     const postCommentsURL = document.getElementById(
       "post-comments-url-" + postID
     ).innerText;
-    const url = postCommentsURL + "?page=" + commentsPageCounter.innerText;
+    let url = postCommentsURL + "?limit=" + COMMENTS_CHUNK_SIZE;
+    if (commentsNextCursor.innerText) {
+      url += "&after=" + commentsNextCursor.innerText;
+    }
     getPostCommentsChunk(url).then((data) => {
       if (data.commentsCount > 0) {
         if (postMoreCommentsLink.innerText == lessCommentsLinkText) {
@@ -91,12 +99,11 @@ const postCommentsPopulation = async (postID, commentsLink) => {
         }
         postCommentsDiv.appendChild(postMoreCommentsLink);
         if (data.hasNext) {
-          commentsPageCounter.innerText =
-            Number(commentsPageCounter.innerText) + 1;
+          commentsNextCursor.innerText = data.nextCursor;
           postMoreCommentsLink.style.display = "block";
         } else {
-          commentsPageCounter.innerText = 1;
-          if (data.commentsCount > 2) {
+          commentsNextCursor.innerText = "";
+          if (data.commentsCount > COMMENTS_CHUNK_SIZE) {
             postMoreCommentsLink.innerText = lessCommentsLinkText;
           } else {
             postMoreCommentsLink.style.display = "none";
@@ -157,38 +164,80 @@ const formHandler = async (
   }
 };
 
-const likesRequestsHandler = async (
-  url,
-  csrfTokenValue,
-  likesCounterElement,
-  buttonToHide,
-  buttonToShow
-) => {
+// The likes/comments counts of many posts, and whether the user liked them, in one request
+const getPostsCounts = async (postIDs) => {
+  try {
+    const response = await fetch(
+      ROOT_URL + "counts/?posts=" + postIDs.join(",")
+    );
+    if (response.ok) {
+      const data = await response.json();
+      return data.posts;
+    } else {
+      console.log("Response =>\n", response);
+      return false;
+    }
+  } catch (error) {
+    console.log("Error =>\n", error);
+    return false;
+  }
+};
+
+const updatePostCard = (postID, counts) => {
+  const likesCountSpan = document.getElementById(
+    "post-likes-count-number-" + postID
+  );
+  const commentsCountSpan = document.getElementById(
+    "post-comments-count-number-" + postID
+  );
+  const likeButton = document.getElementById("like-btn-" + postID);
+  const dislikeButton = document.getElementById("dislike-btn-" + postID);
+  // Only the counts that came (e.g. the like/dislike answers have no comments count)
+  if (likesCountSpan && counts.likes !== undefined) {
+    likesCountSpan.innerText = counts.likes;
+  }
+  if (commentsCountSpan && counts.comments !== undefined) {
+    commentsCountSpan.innerText = counts.comments;
+  }
+  if (likeButton && dislikeButton && counts.likedByUser !== undefined) {
+    likeButton.style.display = counts.likedByUser ? "none" : "block";
+    dislikeButton.style.display = counts.likedByUser ? "block" : "none";
+  }
+};
+
+const updatePostCards = async (postIDs) => {
+  const posts = await getPostsCounts(postIDs);
+  if (!posts) {
+    return false;
+  }
+  for (const postID in posts) {
+    updatePostCard(postID, posts[postID]);
+  }
+  return posts;
+};
+
+const likesRequestsHandler = async (url, csrfTokenValue, postID) => {
   let formData = new FormData();
   formData.append("csrfmiddlewaretoken", csrfTokenValue);
   try {
+    // The answer has the new count and like state, the only redirect is to log in
     const response = await fetch(url, {
       method: "POST",
       body: formData,
+      redirect: "manual",
     });
-    if (response.redirected && response.url.includes("?next=")) {
-      window.location.href = response.url;
-      return true;
-    } else if (response.ok) {
-      try {
-        const jsonResponse = await response.json();
-        likesCounterElement.innerText = jsonResponse.likes;
-        buttonToHide.style.display = "none";
-        buttonToShow.style.display = "block";
-        return true;
-      } catch (error) {
-        console.log("Error =>\n", error);
-        return false;
-      }
-    } else {
+    if (response.type === "opaqueredirect") {
+      // Only the logged in users can like
+      window.location.href =
+        LOGIN_URL + "?next=" + encodeURIComponent(window.location.pathname);
+      return false;
+    }
+    if (!response.ok) {
       console.log("Response =>\n", response);
       return false;
     }
+    updatePostCard(postID, await response.json());
+    return true;
   } catch (error) {
     console.log("Error =>\n", error);
     return false;
@@ -276,16 +325,22 @@ if (CSRFTokenInput) {
         event.preventDefault();
         postLikesCountSpan?.parentElement?.click();
       });
-      let likeListPageCounter = 0;
+      let likeListNextCursor = "";
       let fulfilled = false;
       postLikesCountSpan?.parentElement?.addEventListener("click", (event) => {
         event.preventDefault();
         likesModal.show();
-        likeListPageCounter += !fulfilled ? 1 : 0;
+        if (fulfilled) {
+          return;
+        }
         // Get like list
-        let likesURL = event.target.href;
+        let likesURL =
+          postLikesCountSpan.parentElement.href + "?limit=" + LIKES_CHUNK_SIZE;
+        if (likeListNextCursor) {
+          likesURL += "&after=" + likeListNextCursor;
+        }
         try {
-          fetch(likesURL + "?page=" + likeListPageCounter.toString()).then(
+          fetch(likesURL).then(
             (response) => {
               if (response.ok) {
                 try {
@@ -333,14 +388,12 @@ if (CSRFTokenInput) {
                       }
                     }
                     // Control the presence of 'more likers' link and avoid redundancy the list fulfilled
-                    if (
-                      data.totalLikes > likeListPageCounter * data.chunkSize &&
-                      !fulfilled
-                    ) {
+                    if (data.hasNext && !fulfilled) {
+                      likeListNextCursor = data.nextCursor;
                       moreLikersLink.style.display = "block";
                       likesModalDialog.appendChild(moreLikersLink);
                     } else {
-                      likeListPageCounter = 0;
+                      likeListNextCursor = "";
                       fulfilled = true;
                       moreLikersLink.style.display = "none";
                     }
@@ -381,27 +434,62 @@ if (CSRFTokenInput) {
     const dislikeButton = document.getElementById("dislike-btn-" + postID);
     likeButton?.addEventListener("click", (event) => {
       event.preventDefault();
-      likesRequestsHandler(
-        likeButton.value,
-        CSRFTokenInput.value,
-        postLikesCountSpan,
-        likeButton,
-        dislikeButton
-      ).then((isOk) => {
-        return isOk;
-      });
+      likesRequestsHandler(likeButton.value, CSRFTokenInput.value, postID);
     });
     dislikeButton?.addEventListener("click", (event) => {
       event.preventDefault();
-      likesRequestsHandler(
-        dislikeButton.value,
-        CSRFTokenInput.value,
-        postLikesCountSpan,
-        dislikeButton,
-        likeButton
-      ).then((isOk) => {
-        return isOk;
-      });
+      likesRequestsHandler(dislikeButton.value, CSRFTokenInput.value, postID);
     });
   }
 }
+
+// Refresh the counts of all the posts on the page at once,
+// when it comes back from the browser's cache or after it was hidden for a while
+const pagePostIDs = Array.from(
+  document.querySelectorAll('[id^="post-likes-count-number-"]')
+).map((element) => element.id.match(/\d+/)[0]);
+let pageHiddenAt = null;
+window.addEventListener("pageshow", (event) => {
+  if (event.persisted && pagePostIDs.length > 0) {
+    updatePostCards(pagePostIDs);
+  }
+});
+document.addEventListener("visibilitychange", () => {
+  if (document.visibilityState === "hidden") {
+    pageHiddenAt = Date.now();
+  } else if (
+    pageHiddenAt &&
+    Date.now() - pageHiddenAt > 30000 &&
+    pagePostIDs.length > 0
+  ) {
+    updatePostCards(pagePostIDs);
+  }
+});
+
+// Live likes/comments counts of the posts on the page (only served under ASGI, otherwise the server says 'No Content'),
+// only opened on the pages with post cards, and closed when the page is left
+if (pagePostIDs.length > 0 && window.EventSource) {
+  const countsSource = new EventSource(
+    ROOT_URL + "events/?posts=" + pagePostIDs.join(",")
+  );
+  countsSource.addEventListener("counts", (event) => {
+    const counts = JSON.parse(event.data);
+    if (counts.likes !== undefined) {
+      const likesCountSpan = document.getElementById(
+        "post-likes-count-number-" + counts.post
+      );
+      if (likesCountSpan) {
+        likesCountSpan.innerText = counts.likes;
+      }
+    }
+    if (counts.comments !== undefined) {
+      const commentsCountSpan = document.getElementById(
+        "post-comments-count-number-" + counts.post
+      );
+      if (commentsCountSpan) {
+        commentsCountSpan.innerText = counts.comments;
+      }
+    }
+  });
+  window.addEventListener("pagehide", () => countsSource.close());
+}
@@ -0,0 +1,61 @@
+import threading
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+
+register = template.Library()
+
+# How often this process found a post card in the cache
+_card_cache_stats = {"hits": 0, "misses": 0}
+_card_cache_stats_lock = threading.Lock()
+
+
+def card_cache_stats():
+    with _card_cache_stats_lock:
+        return dict(_card_cache_stats)
+
+
+def _count(result):
+    with _card_cache_stats_lock:
+        _card_cache_stats[result] += 1
+
+
+def card_cache_key(post):
+    """ Any change to the post or its likes/comments counters makes a new key (thus, a new card) """
+    return (
+        f"posts:card:{post.pk}:{post.updated_at.timestamp()}"
+        f":{post.like_count}:{post.comment_count}"
+    )
+
+
+class PostCardNode(template.Node):
+    def __init__(self, nodelist, post):
+        self.nodelist = nodelist
+        self.post = post
+
+    def render(self, context):
+        post = self.post.resolve(context)
+        key = card_cache_key(post)
+        html = cache.get(key)
+        if html is None:
+            _count("misses")
+            html = self.nodelist.render(context)
+            # The timeout refreshes the 'naturaltime' dates and the owner's picture
+            cache.set(key, html, timeout=getattr(settings, "POSTS_CARD_CACHE_TIMEOUT", 60))
+        else:
+            _count("hits")
+        return html
+
+
+@register.tag
+def cachepostcard(parser, token):
+    """
+    Cache the part of the post's card between '{% cachepostcard post %}' and '{% endcachepostcard %}',
+    so it must not have anything that depends on the current user (e.g. 'csrf_token' or the like buttons).
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes the post as its only argument.")
+    nodelist = parser.parse(("endcachepostcard",))
+    parser.delete_first_token()
+    return PostCardNode(nodelist, parser.compile_filter(bits[1]))
@@ -0,0 +1,179 @@
+import os
+import tempfile
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from ..models import Post, Like, User
+from ..likes_buffer import LikesBuffer
+from .. import likes_buffer
+
+
+@override_settings(POSTS_LIKES_WRITE_BEHIND=True)
+@mock.patch.object(LikesBuffer, "start_flusher")
+class WriteBehindLikesTest(TestCase):
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(username="Jack", password=cls.password)
+        cls.user2 = User.objects.create_user(username="Sparrow", password=cls.password)
+        cls.post = Post.objects.create(text="Blah...", owner=cls.user1)
+        Like.objects.create(post=cls.post, owner=cls.user2)
+
+    def setUp(self):
+        cache.clear()
+        self.buffer = LikesBuffer()
+        patcher = mock.patch.object(likes_buffer, "_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assertTrue(self.client.login(username=self.user1.username, password=self.password))
+
+    def like(self, liked=True, post_pk=None):
+        name = "posts:post_like" if liked else "posts:post_dislike"
+        return self.client.post(reverse(name, kwargs={"post_pk": post_pk or self.post.pk}))
+
+    def test_optimistic_count_before_the_flush(self, start_flusher):
+        response = self.like()
+        self.assertEqual(response.json(), {"likes": 2, "likedByUser": True})
+        self.assertFalse(Like.objects.filter(post=self.post, owner=self.user1).exists())
+        start_flusher.assert_called()
+        # The other endpoints see the pending like too
+        counts = self.client.get(reverse("posts:post_counts") + f"?posts={self.post.pk}").json()
+        self.assertEqual(counts["posts"][str(self.post.pk)], {"likes": 2, "comments": 0, "likedByUser": True})
+        self.assertEqual(self.client.get(reverse("posts:post_likes", kwargs={"post_pk": self.post.pk})).json(),
+                         {"likes": 2})
+
+    def test_flush(self, start_flusher):
+        self.like()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(Like.objects.filter(post=self.post, owner=self.user1).exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+        self.assertEqual(self.buffer.delta(self.post.pk), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+        # A dislike of the stored like
+        self.assertEqual(self.like(False).json(), {"likes": 1, "likedByUser": False})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertFalse(Like.objects.filter(post=self.post, owner=self.user1).exists())
+
+    def test_last_toggle_wins(self, start_flusher):
+        self.like()
+        self.like(False)
+        # Back to what is stored, nothing to write
+        self.assertEqual(self.buffer.flush(), 0)
+        self.like()
+        self.like(False)
+        self.assertEqual(self.like().json(), {"likes": 2, "likedByUser": True})
+        # Liking twice doesn't count twice
+        self.assertEqual(self.like().json(), {"likes": 2, "likedByUser": True})
+        self.assertEqual(self.buffer.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+
+    def test_double_dislike(self, start_flusher):
+        self.assertEqual(self.like(False).json(), {"likes": 1, "likedByUser": False})
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_missing_post(self, start_flusher):
+        self.assertEqual(self.like(post_pk=self.post.pk + 100).status_code, 404)
+
+    def test_post_deleted_before_the_flush(self, start_flusher):
+        post = Post.objects.create(text="Gone soon", owner=self.user2)
+        self.like(post_pk=post.pk)
+        post.delete()
+        self.buffer.flush()
+        self.assertFalse(Like.objects.filter(post_id=post.pk).exists())
+
+    def test_failed_flush_keeps_the_toggles(self, start_flusher):
+        self.like()
+        with mock.patch.object(likes_buffer, "write_likes", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.delta(self.post.pk), 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(Like.objects.filter(post=self.post, owner=self.user1).exists())
+
+    def test_toggle_during_a_flush(self, start_flusher):
+        self.like()
+        write_likes = likes_buffer.write_likes
+
+        def write_with_a_dislike(toggles):
+            # Read before the like is written, recorded while it is
+            self.assertFalse(self.buffer.record(self.post.pk, self.user1.pk, False, False, self.buffer.flushes - 1))
+            self.assertTrue(self.buffer.record(self.post.pk, self.user1.pk, False, False, self.buffer.flushes))
+            write_likes(toggles)
+
+        with mock.patch.object(likes_buffer, "write_likes", side_effect=write_with_a_dislike):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(Like.objects.filter(post=self.post, owner=self.user1).exists())
+        self.assertEqual(self.buffer.delta(self.post.pk), -1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertFalse(Like.objects.filter(post=self.post, owner=self.user1).exists())
+
+    def test_toggle_during_a_failed_flush(self, start_flusher):
+        self.like()
+
+        def fail_after_a_dislike(toggles):
+            self.buffer.record(self.post.pk, self.user1.pk, False, False)
+            raise RuntimeError
+
+        with mock.patch.object(likes_buffer, "write_likes", side_effect=fail_after_a_dislike):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        # The like was never written, its dislike leaves nothing to write
+        self.assertEqual(self.buffer.delta(self.post.pk), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_flusher_recycles_its_connection(self, start_flusher):
+        class Stop(Exception):
+            pass
+
+        with mock.patch.object(likes_buffer.time, "sleep", side_effect=[None, Stop]), \
+                mock.patch.object(likes_buffer, "close_old_connections") as close_old_connections:
+            with self.assertRaises(Stop):
+                self.buffer.flush_periodically()
+        # Before and after the flush
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    def test_journal_recovery(self, start_flusher):
+        with tempfile.TemporaryDirectory() as journal_dir:
+            # A process that died before writing its toggles
+            with open(os.path.join(journal_dir, "likes-999999999.jsonl"), "w") as journal:
+                journal.write(f"[{self.post.pk}, {self.user1.pk}, true]\n")
+                journal.write(f"[{self.post.pk}, {self.user2.pk}, false]\n")
+                journal.write(f"[{self.post.pk}, {self.user2.pk}, tr")
+            buffer = LikesBuffer(journal_dir)
+            self.assertEqual(os.listdir(journal_dir), [])
+            self.assertEqual(set(self.post.like_set.values_list("owner", flat=True)), {self.user1.pk})
+            self.post.refresh_from_db()
+            self.assertEqual(self.post.like_count, 1)
+            # This process's toggles are journaled until they are written
+            buffer.record(self.post.pk, self.user2.pk, True, False)
+            self.assertEqual(len(os.listdir(journal_dir)), 1)
+            buffer.flush()
+            self.assertEqual(os.listdir(journal_dir), [])
+
+    def test_journal_after_empty_and_failed_flushes(self, start_flusher):
+        with tempfile.TemporaryDirectory() as journal_dir:
+            buffer = LikesBuffer(journal_dir)
+            # A like and its dislike, journaled but nothing to write
+            buffer.record(self.post.pk, self.user1.pk, True, False)
+            buffer.record(self.post.pk, self.user1.pk, False, False)
+            self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(os.listdir(journal_dir), [])
+            # The toggles of a failed flush are journaled again, for the next flush (or the recovery)
+            buffer.record(self.post.pk, self.user1.pk, True, False)
+            with mock.patch.object(likes_buffer, "write_likes", side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    buffer.flush()
+            self.assertEqual(os.listdir(journal_dir), [os.path.basename(buffer.journal_path())])
+            with open(buffer.journal_path()) as journal:
+                self.assertEqual(journal.read(), f"[{self.post.pk}, {self.user1.pk}, true]\n")
+            self.assertEqual(buffer.flush(), 1)
+            self.assertEqual(os.listdir(journal_dir), [])
+            self.assertTrue(Like.objects.filter(post=self.post, owner=self.user1).exists())
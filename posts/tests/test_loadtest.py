@@ -0,0 +1,36 @@
+import asyncio
+from django.core.cache import cache
+from django.test import LiveServerTestCase, override_settings
+from ..loadtest import DEFAULT_MIX, run_load_test
+from ..models import Post, Comment, UserPicture, User
+
+
+# The live server's threads share the in-memory database's connection, so they count each other's queries
+@override_settings(POSTS_QUERY_BUDGET=1000)
+class LoadTestTest(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(2):
+            user = User.objects.create_user(username=f"synthetic-{i}", password="benchmark")
+            UserPicture.objects.create(user=user)
+            for j in range(2):
+                post = Post.objects.create(title=f"Post #{j}", text="Blah...", owner=user)
+                Comment.objects.create(text="Nice!", post=post, owner=user)
+
+    def test_replay_main_js_traffic(self):
+        summary = asyncio.run(run_load_test({
+            "url": self.live_server_url,
+            "users": 2,
+            "duration": 1,
+            "think_time": 0,
+            "ramp_up": 0,
+            "timeout": 10,
+            "username_prefix": "synthetic-",
+            "password": "benchmark",
+            "mix": DEFAULT_MIX,
+        }))
+        endpoints = summary["endpoints"]
+        # Which actions follow the first page is random
+        for endpoint in ("login", "page", "post_detail", "comments"):
+            self.assertIn(endpoint, endpoints)
+        self.assertEqual(sum(result["errors"] for result in endpoints.values()), 0)
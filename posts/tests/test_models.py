@@ -1,7 +1,11 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.contrib.auth.models import User
 from django.db.utils import IntegrityError
-from ..models import Post, Comment, Like
+from ..models import Post, Comment, Like, UserStats, decay_after
 
 # Create your tests here.
 
@@ -101,3 +105,177 @@ class ModelsRelationsTest (TestCase):
             post=self.post1,
             user=self.user2,
         )
+
+
+class PostCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(
+            username="Jack", password="pass123")
+        cls.user2 = User.objects.create_user(
+            username="Sparrow", password="pass321")
+        cls.post = Post.objects.create(
+            title="Strong Post",
+            text="These are strong words of the strong post.",
+            owner=cls.user1,
+        )
+
+    def test_counters_follow_likes_and_comments(self):
+        like = Like.objects.create(post=self.post, owner=self.user1)
+        Like.objects.create(post=self.post, owner=self.user2)
+        Comment.objects.create(text="Keep it up!", post=self.post, owner=self.user2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+        self.assertEqual(self.post.comment_count, 1)
+        like.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+    def test_counters_follow_cascade_deletes(self):
+        Like.objects.create(post=self.post, owner=self.user2)
+        Comment.objects.create(text="Keep it up!", post=self.post, owner=self.user2)
+        Comment.objects.create(text="Good job!", post=self.post, owner=self.user1)
+        self.user2.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_recount_command_repairs_drift(self):
+        Like.objects.create(post=self.post, owner=self.user2)
+        Comment.objects.create(text="Keep it up!", post=self.post, owner=self.user2)
+        Post.objects.filter(pk=self.post.pk).update(like_count=7, comment_count=0)
+        out = StringIO()
+        call_command("recount_post_counters", stdout=out)
+        self.assertIn("1 post(s)", out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.post.comment_count, 1)
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(
+            username="Jack", password="pass123")
+        cls.user2 = User.objects.create_user(
+            username="Sparrow", password="pass321")
+        cls.post = Post.objects.create(
+            title="Strong Post",
+            text="These are strong words of the strong post.",
+            owner=cls.user1,
+        )
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_stats_follow_posts_likes_and_comments(self):
+        newer = Post.objects.create(title="Newer Post", text="Even stronger.", owner=self.user1)
+        Like.objects.create(post=self.post, owner=self.user2)
+        Like.objects.create(post=newer, owner=self.user1)
+        Comment.objects.create(text="Keep it up!", post=self.post, owner=self.user2)
+        stats = self.stats(self.user1)
+        self.assertEqual(stats.post_count, 2)
+        self.assertEqual(stats.likes_received, 2)
+        self.assertEqual(stats.comments_received, 1)
+        self.assertEqual(stats.last_post_at, newer.created_at)
+        # The user who liked and commented received nothing
+        self.assertEqual(self.stats(self.user2).likes_received, 0)
+
+        newer.delete()
+        stats = self.stats(self.user1)
+        self.assertEqual(stats.post_count, 1)
+        self.assertEqual(stats.likes_received, 1)
+        self.assertEqual(stats.last_post_at, self.post.created_at)
+
+    def test_stats_follow_cascade_deletes(self):
+        Like.objects.create(post=self.post, owner=self.user2)
+        Comment.objects.create(text="Keep it up!", post=self.post, owner=self.user2)
+        self.user2.delete()
+        stats = self.stats(self.user1)
+        self.assertEqual(stats.likes_received, 0)
+        self.assertEqual(stats.comments_received, 0)
+        self.post.delete()
+        stats = self.stats(self.user1)
+        self.assertEqual(stats.post_count, 0)
+        self.assertIsNone(stats.last_post_at)
+
+    def test_refresh_repairs_drift_and_missing_stats(self):
+        Like.objects.create(post=self.post, owner=self.user2)
+        UserStats.objects.filter(user=self.user1).update(post_count=5, likes_received=0)
+        UserStats.objects.filter(user=self.user2).delete()
+        out = StringIO()
+        call_command("recount_post_counters", stdout=out)
+        stats = self.stats(self.user1)
+        self.assertEqual(stats.post_count, 1)
+        self.assertEqual(stats.likes_received, 1)
+        self.assertEqual(UserStats.objects.refresh([self.user2.pk]), 1)
+        self.assertEqual(self.stats(self.user2).post_count, 0)
+
+
+@override_settings(POSTS_TRENDING_GRAVITY=1.8, POSTS_TRENDING_COMMENT_WEIGHT=1, POSTS_TRENDING_WINDOW_HOURS=48)
+class TrendingScoreTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f"User{i}", password="pass123")
+            for i in range(3)
+        ]
+        cls.post = Post.objects.create(
+            title="Strong Post",
+            text="These are strong words of the strong post.",
+            owner=cls.users[0],
+        )
+
+    def test_score_follows_likes_and_comments(self):
+        for user in self.users:
+            Like.objects.create(post=self.post, owner=user)
+        comment = Comment.objects.create(text="Keep it up!", post=self.post, owner=self.users[1])
+        self.post.refresh_from_db()
+        self.assertAlmostEqual(self.post.trending_score, 4 * decay_after(0))
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertAlmostEqual(self.post.trending_score, 3 * decay_after(0))
+
+    def test_recompute_decays_by_age(self):
+        older = Post.objects.create(title="Older Post", text="Once popular.", owner=self.users[1])
+        Post.objects.filter(pk=older.pk).update(created_at=self.post.created_at - timedelta(hours=10))
+        for user in self.users:
+            Like.objects.create(post=older, owner=user)
+        Like.objects.create(post=self.post, owner=self.users[0])
+        self.assertEqual(Post.objects.recompute_trending(now=self.post.created_at + timedelta(hours=1)), 2)
+        self.post.refresh_from_db()
+        older.refresh_from_db()
+        self.assertAlmostEqual(self.post.trending_score, 1 / 3 ** 1.8)
+        self.assertAlmostEqual(older.trending_score, 3 / 13 ** 1.8)
+        # A like counts as much as the others of the post's age then
+        Like.objects.create(post=self.post, owner=self.users[1])
+        self.post.refresh_from_db()
+        self.assertAlmostEqual(self.post.trending_score, 2 / 3 ** 1.8)
+
+    def test_recompute_drops_old_posts(self):
+        Like.objects.create(post=self.post, owner=self.users[0])
+        Post.objects.recompute_trending(now=self.post.created_at + timedelta(hours=49))
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.trending_score, self.post.trending_decay), (0, 0))
+        Like.objects.create(post=self.post, owner=self.users[1])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.trending_score, 0)
+
+    def test_recount_repairs_the_score(self):
+        Like.objects.create(post=self.post, owner=self.users[0])
+        Post.objects.filter(pk=self.post.pk).update(trending_score=7)
+        call_command("recount_post_counters", stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertAlmostEqual(self.post.trending_score, decay_after(0))
+
+
+class BenchmarkFeedCommandTest(TestCase):
+    def test_measures_and_rolls_back(self):
+        out = StringIO()
+        call_command("benchmark_feed", followers=[2], posts=1, reads=2, stdout=out)
+        self.assertIn(" push ", out.getvalue())
+        self.assertFalse(User.objects.exists())
+
+    def test_too_few_reads_for_the_p95(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_feed", followers=[2], reads=1, stdout=StringIO())
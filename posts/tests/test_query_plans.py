@@ -0,0 +1,84 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.urls import reverse
+from ..models import Post, Comment, Like, UserPicture, User
+
+
+class QueryPlanTest(TestCase):
+    """ Every view's main (ordered) query must walk an index, not scan the table and sort it """
+
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f"User{i}", password=cls.password)
+            for i in range(3)
+        ]
+        for user in cls.users:
+            UserPicture.objects.create(user=user)
+        for i in range(8):
+            post = Post.objects.create(title=f"Post #{i}", text="Blah...", owner=cls.users[i % 2])
+        cls.post = post
+        for user in cls.users:
+            Comment.objects.create(text="Comment...", post=post, owner=user)
+            Like.objects.create(post=post, owner=user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username=self.users[0].username, password=self.password)
+
+    def main_query(self, url, table):
+        """ Request the url, and return the plan of its ordered query that selects from the table """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = [
+            query["sql"] for query in queries
+            if query["sql"].startswith("SELECT") and f'FROM "{table}"' in query["sql"] and "ORDER BY" in query["sql"]
+        ]
+        self.assertTrue(sql, f"No ordered query on '{table}' for '{url}'.")
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql[-1])
+            return "\n".join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn(f"USING INDEX {index}", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def next_page(self, url, cursor_name):
+        data = self.client.get(url + "?limit=1").json()
+        return url + f"?limit=1&{cursor_name}=" + data["nextCursor"]
+
+    def test_index_view(self):
+        cursor = self.client.get(reverse("posts:index")).context["page_obj"].next_cursor
+        plan = self.main_query(reverse("posts:index") + "?cursor=" + cursor, "posts_post")
+        self.assertUsesIndex(plan, "posts_post_created_idx")
+
+    def test_trending_view(self):
+        url = reverse("posts:trending")
+        self.assertUsesIndex(self.main_query(url, "posts_post"), "posts_post_trending_idx")
+        for post in Post.objects.exclude(pk=self.post.pk):
+            Like.objects.create(post=post, owner=self.users[0])
+        cursor = self.client.get(url).context["page_obj"].next_cursor
+        self.assertUsesIndex(self.main_query(url + "?cursor=" + cursor, "posts_post"), "posts_post_trending_idx")
+
+    def test_profile_view(self):
+        url = reverse("posts:profile", kwargs={"username": self.users[0].username})
+        self.assertUsesIndex(self.main_query(url, "posts_post"), "posts_post_owner_created_idx")
+        cursor = self.client.get(url).context["page_obj"].next_cursor
+        self.assertUsesIndex(self.main_query(url + "?cursor=" + cursor, "posts_post"), "posts_post_owner_created_idx")
+
+    def test_post_comments_view(self):
+        url = reverse("posts:post_comments", kwargs={"post_pk": self.post.pk})
+        self.assertUsesIndex(self.main_query(url, "posts_comment"), "posts_comment_post_created_idx")
+        plan = self.main_query(self.next_page(url, "after"), "posts_comment")
+        self.assertUsesIndex(plan, "posts_comment_post_created_idx")
+
+    def test_like_list_view(self):
+        url = reverse("posts:post_like_list", kwargs={"post_pk": self.post.pk})
+        self.assertUsesIndex(self.main_query(url, "posts_like"), "posts_like_post_created_idx")
+        plan = self.main_query(self.next_page(url, "after"), "posts_like")
+        self.assertUsesIndex(plan, "posts_like_post_created_idx")
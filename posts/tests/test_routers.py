@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import tempfile
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from ..models import Post, User, UserPicture
+from ..routers import STICKY_COOKIE
+
+
+@override_settings(POSTS_READ_REPLICAS=["replica"])
+class ReadReplicaTest(TransactionTestCase):
+    """ With a copy of the database file as the replica, changed behind the primary's back to tell them apart """
+
+    # "__all__" takes the replica in, once "setUpClass()" added it (the test runner only knows "default")
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings["replica"] = {
+            **connections.settings["default"],
+            "NAME": os.path.join(cls.directory.name, "replica.sqlite3"),
+            "TEST": {**connections.settings["default"]["TEST"], "MIRROR": None},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="Jack", password="pass123")
+        UserPicture.objects.create(user=self.user)
+        self.post = Post.objects.create(title="Primary", text="On the primary", owner=self.user)
+        self.client.force_login(self.user)
+        self.copy_to_replica()
+        Post.objects.using("replica").filter(pk=self.post.pk).update(text="On the replica", like_count=42)
+
+    def copy_to_replica(self):
+        connections["replica"].close()
+        connections["default"].ensure_connection()
+        replica = sqlite3.connect(connections.settings["replica"]["NAME"])
+        connections["default"].connection.backup(replica)
+        replica.close()
+
+    def detail_text(self):
+        response = self.client.get(reverse(
+            "posts:post_detail", kwargs={"username": self.user.username, "post_pk": self.post.pk}))
+        self.assertEqual(response.status_code, 200)
+        return "On the replica" if "On the replica" in response.content.decode() else "On the primary"
+
+    def test_read_only_views_read_from_the_replica(self):
+        self.assertEqual(self.detail_text(), "On the replica")
+        self.assertEqual(
+            self.client.get(reverse("posts:post_likes", kwargs={"post_pk": self.post.pk})).json(), {"likes": 42})
+        # The other views read from the primary
+        counts = self.client.get(reverse("posts:post_counts") + f"?posts={self.post.pk}").json()
+        self.assertEqual(counts["posts"][str(self.post.pk)]["likes"], 0)
+
+    def test_sticky_after_write(self):
+        response = self.client.post(
+            reverse("posts:comment_create", kwargs={"post_pk": self.post.pk}), {"text": "Nice!"})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.detail_text(), "On the primary")
+        self.assertEqual(self.post.comment_set.using("default").count(), 1)
+
+    def test_replica_again_after_the_sticky_window(self):
+        self.client.post(reverse("posts:comment_create", kwargs={"post_pk": self.post.pk}), {"text": "Nice!"})
+        self.assertEqual(self.detail_text(), "On the primary")
+        # The cookie of a write that is older than the window (the browser may still send it)
+        until = float(self.client.cookies[STICKY_COOKIE].value)
+        self.client.cookies[STICKY_COOKIE] = f"{until - 3600:.3f}"
+        self.assertEqual(self.detail_text(), "On the replica")
+
+    def test_writes_go_to_the_primary(self):
+        response = self.client.post(reverse("posts:post_like", kwargs={"post_pk": self.post.pk}))
+        self.assertEqual(response.json(), {"likes": 1, "likedByUser": True})
+        self.assertEqual(Post.objects.using("replica").get(pk=self.post.pk).like_count, 42)
+
+    @override_settings(POSTS_READ_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.detail_text(), "On the primary")
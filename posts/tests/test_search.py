@@ -0,0 +1,114 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from ..inverted_index import InvertedIndex, _contains
+from ..models import Post, User
+from .. import search
+
+
+class InvertedIndexTest(TestCase):
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.add(1, "The quick brown fox")
+        self.index.add(2, "The lazy dog")
+        self.index.add(3, "Quick foxes jump")
+
+    def test_search_all_words(self):
+        self.assertEqual(self.index.search("the"), [2, 1])
+        self.assertEqual(self.index.search("QUICK fox", prefix=False), [1])
+        self.assertEqual(self.index.search("quick fox"), [3, 1])
+        self.assertEqual(self.index.search("cat"), [])
+        self.assertEqual(self.index.search("..."), [])
+
+    def test_update_and_remove(self):
+        self.index.add(1, "A slow brown fox")
+        self.assertEqual(self.index.search("quick"), [3])
+        self.index.remove(3)
+        self.assertEqual(self.index.search("quick"), [])
+        self.assertEqual(self.index.search("fox"), [1])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.bin")
+            self.index.save(path)
+            loaded = InvertedIndex.load(path)
+            self.assertEqual(loaded.search("quick fox"), [3, 1])
+            # The memory-mapped index is still updatable
+            loaded.remove(1)
+            loaded.add(4, "Another fox")
+            self.assertEqual(loaded.search("fox"), [4, 3])
+            del loaded
+
+    def test_new_documents_do_not_scan_the_vocabulary(self):
+        for doc_id in range(10, 1010):
+            self.index.add(doc_id, f"word{doc_id} common")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.bin")
+            self.index.save(path)
+            loaded = InvertedIndex.load(path)
+            with mock.patch("posts.inverted_index._contains", wraps=_contains) as contains:
+                loaded.add(2000, "A new fox")
+                loaded.remove(3000)
+                # Only whether they were in the file
+                self.assertEqual(contains.call_count, 2)
+                # A document from the file is looked for in all of the postings
+                loaded.remove(10)
+                self.assertGreater(contains.call_count, 1000)
+            self.assertEqual(loaded.search("fox"), [2000, 3, 1])
+            self.assertEqual(loaded.search("common"), list(range(1009, 10, -1)))
+            del loaded
+
+
+@override_settings(POSTS_SEARCH_BACKEND="memory")
+class MemorySearchBackendTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="Jack", password="pass123")
+        Post.objects.create(title="Foo", text="....", owner=user)
+        Post.objects.create(text="Bar...", owner=user)
+
+    def setUp(self):
+        patcher = mock.patch("posts.search._inverted_index", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, query):
+        response = self.client.get(reverse("posts:post_search") + "?q=" + query)
+        self.assertEqual(response.status_code, 200)
+        return [post.title for post in response.context["post_list"]]
+
+    def test_search_follows_post_changes(self):
+        self.assertEqual(self.search("fo"), ["Foo"])
+        post = Post.objects.get(title="Foo")
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title = "Qux"
+            post.save()
+        self.assertEqual(self.search("fo"), [])
+        self.assertEqual(self.search("qux"), ["Qux"])
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.search("qux"), [])
+
+    def test_saved_index_catches_up_with_the_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.bin")
+            call_command("build_search_index", path=path, stdout=StringIO())
+            # Saved after the file was written
+            Post.objects.create(title="Baz", text="....", owner=User.objects.get())
+            Post.objects.filter(title="Foo").update(title="Quux", updated_at=timezone.now())
+            with override_settings(POSTS_SEARCH_INDEX_PATH=path, POSTS_SEARCH_SYNC_INTERVAL=60):
+                self.assertEqual(self.search("baz"), ["Baz"])
+                self.assertEqual(self.search("quux"), ["Quux"])
+                self.assertEqual(self.search("fo"), [])
+                # By another process (without the signals), until the next sync
+                Post.objects.filter(title="Baz").update(title="Corge", updated_at=timezone.now())
+                self.assertEqual(self.search("corge"), [])
+                with override_settings(POSTS_SEARCH_SYNC_INTERVAL=0):
+                    self.assertEqual(self.search("corge"), ["Corge"])
+            # Unmap the file before removing it
+            search._inverted_index = None
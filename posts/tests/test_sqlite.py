@@ -0,0 +1,62 @@
+import os
+import tempfile
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from ..backends.sqlite3.base import connection_stats, record_reuse
+from ..sqlite import apply_pragmas, pragmas
+
+
+class SQLiteProfileTest(SimpleTestCase):
+    def new_connection(self):
+        """ A new connection to a database file (the test database is in memory, with no journal file) """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        default = connections["default"]
+        wrapper = default.__class__({**default.settings_dict, "NAME": os.path.join(directory.name, "db")})
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    @override_settings(POSTS_SQLITE_PRAGMAS={"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 1234})
+    def test_pragmas_on_new_connections(self):
+        wrapper = self.new_connection()
+        wrapper.ensure_connection()
+        self.assertEqual(pragmas(wrapper), {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 1234})
+
+    @override_settings(POSTS_SQLITE_PRAGMAS={"journal_mode": "WAL; DROP TABLE posts_post"})
+    def test_invalid_pragma(self):
+        wrapper = self.new_connection()
+        with self.assertRaises(ValueError):
+            wrapper.ensure_connection()
+
+    @override_settings(POSTS_SQLITE_TRANSACTION_MODE="IMMEDIATE")
+    def test_transaction_mode(self):
+        wrapper = self.new_connection()
+        wrapper.ensure_connection()
+        with CaptureQueriesContext(wrapper) as queries:
+            wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            wrapper.rollback()
+            wrapper.set_autocommit(True)
+        self.assertEqual(queries[0]["sql"], "BEGIN IMMEDIATE")
+
+    def test_other_databases_untouched(self):
+        class OtherConnection:
+            vendor = "postgresql"
+        apply_pragmas(OtherConnection())
+
+    def test_connection_stats(self):
+        before = connection_stats()
+        wrapper = self.new_connection()
+        wrapper.ensure_connection()
+        record_reuse(wrapper)
+        stats = connection_stats()
+        self.assertEqual(stats["opened"], before["opened"] + 1)
+        self.assertEqual(stats["reused"], before["reused"] + 1)
+        self.assertEqual(stats["open"], before["open"] + 1)
+        self.assertGreater(stats["connectMs"], before["connectMs"])
+        wrapper.close()
+        record_reuse(wrapper)
+        stats = connection_stats()
+        self.assertEqual(stats["closed"], before["closed"] + 1)
+        self.assertEqual(stats["reused"], before["reused"] + 1)
+        self.assertEqual(stats["open"], before["open"])
@@ -1,13 +1,37 @@
-from django.test import TestCase
+import warnings
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
 from django.urls import reverse
 from django.contrib.humanize.templatetags.humanize import naturaltime
-from ..models import Post, Comment, Like, UserPicture, User
+from ..models import Post, Comment, Like, UserPicture, User, FeedEntry
 from ..forms import PostModelForm, CommentModelForm
+from .. import events, timeline, views
 
 # NOTE: Firstly, some views were restricted to logged in users but this behavior changed (deliberately).
 # Thats why some of the functions which test whether the user is logged in or not, are commented out.
 
 
+class QueryBudgetMixin:
+    """ A view's queries must not grow past its budget (e.g. a query per post) """
+
+    def assertQueryBudget(self, budget, url, method="get", **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"'{url}' made {len(queries)} queries (the budget is {budget}):\n"
+            + "\n".join(query["sql"] for query in queries),
+        )
+        return response
+
+
 class IndexViewTest(TestCase):
     username = "Jack"
     password = "pass123"
@@ -39,6 +63,10 @@ class IndexViewTest(TestCase):
             owner=user,
         )
 
+    def setUp(self):
+        # The ids (thus, the cached timeline) are reused between the tests
+        cache.clear()
+
     # def test_redirect_without_log_in(self):
     #     profile_url = reverse("posts:index")
     #     response = self.client.get(profile_url)
@@ -82,6 +110,155 @@ class IndexViewTest(TestCase):
         )
         self.client.logout()
 
+    def test_feed_queries_do_not_grow_with_likes_and_comments(self):
+        user = User.objects.get(username=self.username)
+        UserPicture.objects.create(picture_path=0, user=user)
+        for post in Post.objects.all():
+            Like.objects.create(post=post, owner=user)
+            Comment.objects.create(text="Nice!", post=post, owner=user)
+            Comment.objects.create(text="Nice again!", post=post, owner=user)
+        is_logged_in = self.client.login(
+            username=self.username,
+            password=self.password,
+        )
+        self.assertTrue(is_logged_in)
+        # Build the timeline
+        self.client.get(reverse("posts:index"))
+        # Session, user, user's picture and the posts page itself (no posts count)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("posts:index"))
+        self.assertEqual(response.status_code, 200)
+        for post in response.context["post_list"]:
+            self.assertEqual(post.like_count, 1)
+            self.assertEqual(post.comment_count, 2)
+            self.assertTrue(post.liked_by_user)
+        self.assertContains(response, "2</span>", count=3)
+        self.client.logout()
+
+    def test_cursor_pagination(self):
+        posts = list(Post.objects.order_by("-created_at", "-id"))
+        response = self.client.get(reverse("posts:index"))
+        self.assertEqual(response.status_code, 200)
+        page_obj = response.context["page_obj"]
+        self.assertEqual(list(response.context["post_list"]), posts[:3])
+        self.assertFalse(page_obj.has_previous())
+        self.assertTrue(page_obj.has_next())
+        self.assertContains(response, "cursor=" + page_obj.next_cursor)
+        # The next page has the rest of posts
+        response = self.client.get(
+            reverse("posts:index") + "?cursor=" + page_obj.next_cursor)
+        self.assertEqual(response.status_code, 200)
+        page_obj = response.context["page_obj"]
+        self.assertEqual(list(response.context["post_list"]), posts[3:])
+        self.assertFalse(page_obj.has_next())
+        self.assertTrue(page_obj.has_previous())
+        # And the previous one is the first page again
+        response = self.client.get(
+            reverse("posts:index") + "?cursor=" + page_obj.previous_cursor)
+        self.assertEqual(list(response.context["post_list"]), posts[:3])
+        # An invalid cursor falls back to the first page
+        response = self.client.get(reverse("posts:index") + "?cursor=foo")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["post_list"]), posts[:3])
+
+    def test_first_page_from_timeline(self):
+        user = User.objects.get(username=self.username)
+        self.client.get(reverse("posts:index"))
+        # The session-less request only needs the page's posts
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("posts:index"))
+        self.assertEqual(response.context["post_list"][0].title, "Post #4")
+        # New posts go to the top, deleted ones leave
+        new_post = Post.objects.create(title="Post #5", text="Blah!", owner=user)
+        response = self.client.get(reverse("posts:index"))
+        self.assertEqual(response.context["post_list"][0], new_post)
+        new_post.delete()
+        response = self.client.get(reverse("posts:index"))
+        self.assertEqual(response.context["post_list"][0].title, "Post #4")
+        # The timeline's page links to the rest of posts
+        response = self.client.get(
+            reverse("posts:index") + "?cursor=" + response.context["page_obj"].next_cursor)
+        self.assertEqual(
+            [post.title for post in response.context["post_list"]], ["Post #1"])
+
+    def test_full_timeline(self):
+        user = User.objects.get(username=self.username)
+        with self.settings(POSTS_TIMELINE_SIZE=2):
+            self.assertEqual(len(timeline.newest_ids(10)), 2)
+            post = Post.objects.create(title="Post #5", text="Blah!", owner=user)
+            post_id = post.id
+            self.assertEqual(timeline.newest_ids(10), [post_id, post_id - 1])
+            post.delete()
+            self.assertEqual(timeline.newest_ids(10), [post_id - 1, post_id - 2])
+
+    def test_page_number_fallback(self):
+        posts = list(Post.objects.order_by("-created_at", "-id"))
+        response = self.client.get(reverse("posts:index") + "?page=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["post_list"]), posts[3:])
+        self.assertEqual(response.context["page_obj"].number, 2)
+        self.assertContains(response, "?page=1")
+
+
+class PostCardCacheTest(TestCase):
+    username1 = "Jack"
+    username2 = "Sparrow"
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(
+            username=cls.username1, password=cls.password)
+        cls.user2 = User.objects.create_user(
+            username=cls.username2, password=cls.password, is_staff=True)
+        cls.post = Post.objects.create(text="Blah...", owner=cls.user1)
+
+    def setUp(self):
+        # The ids (thus, the cache keys) are reused between the tests
+        cache.clear()
+
+    def get_stats(self):
+        self.client.login(username=self.username2, password=self.password)
+        response = self.client.get(reverse("posts:stats"))
+        self.assertEqual(response.status_code, 200)
+        self.client.logout()
+        return response.json()["cardCache"]
+
+    def test_shared_card_with_per_user_parts(self):
+        Like.objects.create(post=self.post, owner=self.user1)
+        delete_url = reverse("posts:post_delete", kwargs={
+            "username": self.username1,
+            "post_pk": self.post.id,
+        })
+        stats = self.get_stats()
+        # The owner, who liked the post
+        self.client.login(username=self.username1, password=self.password)
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, delete_url)
+        self.assertContains(response, 'style="display: none;"\n                id="like-btn-')
+        self.client.logout()
+        # Another user, who didn't like it, gets the same cached card
+        self.client.login(username=self.username2, password=self.password)
+        response = self.client.get(reverse("posts:index"))
+        self.assertNotContains(response, delete_url)
+        self.assertContains(response, 'style="display: none;"\n                id="dislike-btn-')
+        self.client.logout()
+        new_stats = self.get_stats()
+        self.assertEqual(new_stats["misses"], stats["misses"] + 1)
+        self.assertEqual(new_stats["hits"], stats["hits"] + 1)
+
+    def test_card_changes_with_counters(self):
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, "0</span> Likes")
+        Like.objects.create(post=self.post, owner=self.user2)
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, "1</span> Likes")
+
+    def test_stats_only_for_staff(self):
+        self.client.login(username=self.username1, password=self.password)
+        response = self.client.get(reverse("posts:stats"))
+        self.assertEqual(response.status_code, 403)
+
 
 class ProfileViewTest(TestCase):
     username = "Jack"
@@ -222,6 +399,144 @@ class ProfileViewTest(TestCase):
             i += 1
         self.assertTrue(response.context["page_obj"].has_next())
 
+    def test_header_stats_without_counting_posts(self):
+        self.client.force_login(self.user1)
+        url = reverse("posts:profile", kwargs={"username": self.username2}) + "?page=1"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["stats"].post_count, 4)
+        self.assertEqual(response.context["paginator"].num_pages, 2)
+        self.assertContains(response, "4 posts")
+        self.assertFalse([q for q in queries.captured_queries if "COUNT(" in q["sql"]])
+
+
+class FeedViewTest(TestCase):
+    usernames = ["Jack", "Sparrow", "Barbossa"]
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.stranger = [
+            User.objects.create_user(username=username, password=cls.password)
+            for username in cls.usernames
+        ]
+        cls.old_post = Post.objects.create(text="Before the follow.", owner=cls.author)
+
+    def setUp(self):
+        self.assertTrue(self.client.login(
+            username=self.reader.username,
+            password=self.password,
+        ))
+
+    def get_feed(self, cursor=""):
+        response = self.client.get(reverse("posts:feed") + "?cursor=" + cursor)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def follow(self, user):
+        response = self.client.post(
+            reverse("posts:follow", kwargs={"username": user.username}))
+        self.assertRedirects(
+            response, reverse("posts:profile", kwargs={"username": user.username}))
+
+    def test_redirect_without_log_in(self):
+        self.client.logout()
+        response = self.client.get(reverse("posts:feed"))
+        self.assertRedirects(response, reverse("login") + "?next=" + reverse("posts:feed"))
+
+    def test_followed_and_own_posts_only(self):
+        self.assertEqual(len(self.get_feed().context["post_list"]), 0)
+        self.follow(self.author)
+        # The followed user's old posts are in the feed right away
+        self.assertEqual(list(self.get_feed().context["post_list"]), [self.old_post])
+        own_post = Post.objects.create(text="Mine.", owner=self.reader)
+        new_post = Post.objects.create(text="After the follow.", owner=self.author)
+        Post.objects.create(text="Not followed.", owner=self.stranger)
+        self.assertEqual(
+            list(self.get_feed().context["post_list"]),
+            [new_post, own_post, self.old_post],
+        )
+        self.assertTrue(FeedEntry.objects.filter(owner=self.reader, post=new_post).exists())
+        response = self.client.get(
+            reverse("posts:profile", kwargs={"username": self.author.username}))
+        self.assertTrue(response.context["is_following"])
+        # Unfollowing takes the posts out
+        self.client.post(
+            reverse("posts:unfollow", kwargs={"username": self.author.username}))
+        self.assertEqual(list(self.get_feed().context["post_list"]), [own_post])
+
+    def test_pulled_posts_of_users_with_many_followers(self):
+        self.follow(self.author)
+        with self.settings(POSTS_FEED_PUSH_LIMIT=0):
+            new_post = Post.objects.create(text="Too many followers.", owner=self.author)
+        self.assertFalse(new_post.fanned_out)
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        self.assertEqual(
+            list(self.get_feed().context["post_list"]), [new_post, self.old_post])
+
+    def test_feed_pages(self):
+        self.follow(self.author)
+        posts = [self.old_post] + [
+            Post.objects.create(text=f"Post #{i}", owner=self.author if i % 2 else self.reader)
+            for i in range(4)
+        ]
+        response = self.get_feed()
+        self.assertEqual(list(response.context["post_list"]), posts[:1:-1])
+        response = self.get_feed(response.context["page_obj"].next_cursor)
+        self.assertEqual(list(response.context["post_list"]), posts[1::-1])
+        self.assertFalse(response.context["page_obj"].has_next())
+
+
+class TrendingViewTest(TestCase):
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f"User{i}", password=cls.password)
+            for i in range(3)
+        ]
+        cls.quiet_post = Post.objects.create(text="Nobody likes me.", owner=cls.users[0])
+        cls.posts = [Post.objects.create(text=f"Post #{i}", owner=cls.users[0]) for i in range(4)]
+        # The posts get 1, 2, 3 and 3 likes
+        for i, post in enumerate(cls.posts):
+            for user in cls.users[:min(i + 1, 3)]:
+                Like.objects.create(post=post, owner=user)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_trending(self, cursor=""):
+        response = self.client.get(reverse("posts:trending") + "?cursor=" + cursor)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_best_first_without_the_posts_nobody_liked(self):
+        first = self.get_trending()
+        # The ties by the newest first
+        self.assertEqual(list(first.context["post_list"]), [self.posts[3], self.posts[2], self.posts[1]])
+        second = self.get_trending(first.context["page_obj"].next_cursor)
+        self.assertEqual(list(second.context["post_list"]), [self.posts[0]])
+        self.assertFalse(second.context["page_obj"].has_next())
+
+    def test_new_likes_move_a_post_up(self):
+        self.client.login(username=self.users[0].username, password=self.password)
+        response = self.client.post(reverse("posts:post_like", kwargs={"post_pk": self.quiet_post.pk}))
+        self.assertEqual(response.status_code, 200)
+        for user in self.users:
+            Comment.objects.create(text="Nice!", post=self.quiet_post, owner=user)
+        self.assertEqual(self.get_trending().context["post_list"][0], self.quiet_post)
+
+    def test_older_posts_decay(self):
+        Post.objects.filter(pk=self.posts[3].pk).update(created_at=self.posts[3].created_at - timedelta(hours=5))
+        Post.objects.recompute_trending()
+        # Its 3 likes 5 hours ago are worth less than 1 like now
+        first = self.get_trending()
+        self.assertEqual(list(first.context["post_list"]), [self.posts[2], self.posts[1], self.posts[0]])
+        second = self.get_trending(first.context["page_obj"].next_cursor)
+        self.assertEqual(list(second.context["post_list"]), [self.posts[3]])
+
 
 class PostDetailViewTest(TestCase):
     username = "Jack"
@@ -457,6 +772,8 @@ class PostCommentsViewTest(TestCase):
 
     def setUp(self):
         """ Attributes for the post and its comments. """
+        # The ids (thus, the cache keys) are reused between the tests
+        cache.clear()
         self.post = Post.objects.first()
         self.comments_qs = (Comment.objects.filter(post=self.post)
                             .select_related().order_by("-created_at"))
@@ -607,6 +924,70 @@ class PostCommentsViewTest(TestCase):
         self.assertFalse(json_resp["hasNext"])
         self.client.logout()
 
+    def test_comments_chunks_by_cursor(self):
+        url = reverse("posts:post_comments", kwargs={"post_pk": self.post.id})
+        response = self.client.get(url + "?limit=3")
+        self.assertEqual(response.status_code, 200)
+        json_resp = response.json()
+        self.assertEqual(
+            [comment_obj["id"] for comment_obj in json_resp["commentsChunk"]],
+            [1, 2, 3],
+        )
+        self.assertTrue(json_resp["hasNext"])
+        self.assertEqual(json_resp["commentsCount"], 5)
+        response = self.client.get(
+            url + "?limit=3&after=" + json_resp["nextCursor"])
+        json_resp = response.json()
+        self.assertEqual(
+            [comment_obj["id"] for comment_obj in json_resp["commentsChunk"]],
+            [4, 5],
+        )
+        self.assertFalse(json_resp["hasNext"])
+        self.assertIsNone(json_resp["nextCursor"])
+
+    def test_comments_chunk_limit_is_capped(self):
+        url = reverse("posts:post_comments", kwargs={"post_pk": self.post.id})
+        for limit in ("0", "-1", "foo"):
+            response = self.client.get(url + "?limit=" + limit)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(len(response.json()["commentsChunk"]) > 0)
+        response = self.client.get(url + "?limit=1000000")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["commentsChunk"]), 5)
+
+    def test_comments_cache_key_of_junk_query_values(self):
+        url = reverse("posts:post_comments", kwargs={"post_pk": self.post.id})
+        first_chunk = self.client.get(url).json()
+        # Not a valid key for memcached, if it went into the key as it is
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, {"after": "foo bar\x01" + "x" * 300, "limit": "two"})
+        self.assertEqual(response.json(), first_chunk)
+
+    def test_comments_cached_until_comments_change(self):
+        url = reverse("posts:post_comments", kwargs={"post_pk": self.post.id}) + "?limit=10"
+        self.assertEqual(len(self.client.get(url).json()["commentsChunk"]), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(url).json()["commentsChunk"]), 5)
+        Comment.objects.create(text="One more!", post=self.post, owner=self.post.owner)
+        json_resp = self.client.get(url).json()
+        self.assertEqual(len(json_resp["commentsChunk"]), 6)
+        self.assertEqual(json_resp["commentsCount"], 6)
+
+    def test_evicted_generation_does_not_bring_back_old_comments(self):
+        url = reverse("posts:post_comments", kwargs={"post_pk": self.post.id}) + "?limit=10"
+        generation_key = f"posts:comments:{self.post.id}:generation"
+        self.client.get(url)
+        Comment.objects.create(text="One more!", post=self.post, owner=self.post.owner)
+        self.assertEqual(len(self.client.get(url).json()["commentsChunk"]), 6)
+        # Evicted, then read or invalidated again
+        cache.delete(generation_key)
+        self.assertEqual(len(self.client.get(url).json()["commentsChunk"]), 6)
+        cache.delete(generation_key)
+        Comment.objects.create(text="And another!", post=self.post, owner=self.post.owner)
+        self.assertEqual(len(self.client.get(url).json()["commentsChunk"]), 7)
+
 
 class PostLikesAndPostDislikeViewsTest(TestCase):
     username1 = "Jack"
@@ -624,6 +1005,8 @@ class PostLikesAndPostDislikeViewsTest(TestCase):
         Post.objects.create(text="Blah 2...", owner=user2)
 
     def setUp(self):
+        # The ids (thus, the cache keys) are reused between the tests
+        cache.clear()
         self.user1 = User.objects.first()
         self.user2 = User.objects.last()
         self.post1 = Post.objects.first()
@@ -686,29 +1069,19 @@ class PostLikesAndPostDislikeViewsTest(TestCase):
         self.assertTrue(self.login_logic(self.username1, self.password1))
         response = self.client.post(
             reverse("posts:post_like", kwargs={"post_pk": self.post1.id}),
-            follow=True,
-        )
-        self.assertRedirects(
-            response,
-            reverse("posts:post_likes", kwargs={"post_pk": self.post1.id})
         )
+        self.assertEqual(response.status_code, 200)
         json_resp = response.json()
-        self.assertTrue("likes" in json_resp)
-        self.assertEqual(json_resp["likes"], 1)
+        self.assertEqual(json_resp, {"likes": 1, "likedByUser": True})
         self.client.logout()
         # 'user2' like 'post1'
         self.assertTrue(self.login_logic(self.username2, self.password2))
         response = self.client.post(
             reverse("posts:post_like", kwargs={"post_pk": self.post1.id}),
-            follow=True,
-        )
-        self.assertRedirects(
-            response,
-            reverse("posts:post_likes", kwargs={"post_pk": self.post1.id})
         )
+        self.assertEqual(response.status_code, 200)
         json_resp = response.json()
-        self.assertTrue("likes" in json_resp)
-        self.assertEqual(json_resp["likes"], 2)
+        self.assertEqual(json_resp, {"likes": 2, "likedByUser": True})
         self.client.logout()
 
     def test_likes_count_after_some_dislikes(self):
@@ -716,31 +1089,49 @@ class PostLikesAndPostDislikeViewsTest(TestCase):
         self.assertTrue(self.login_logic(self.username1, self.password1))
         response = self.client.post(
             reverse("posts:post_dislike", kwargs={"post_pk": self.post2.id}),
-            follow=True,
-        )
-        self.assertRedirects(
-            response,
-            reverse("posts:post_likes", kwargs={"post_pk": self.post2.id})
         )
+        self.assertEqual(response.status_code, 200)
         json_resp = response.json()
-        self.assertTrue("likes" in json_resp)
-        self.assertEqual(json_resp["likes"], 1)
+        self.assertEqual(json_resp, {"likes": 1, "likedByUser": False})
         self.client.logout()
         # 'user2' dislike 'post2'
         self.assertTrue(self.login_logic(self.username2, self.password2))
         response = self.client.post(
             reverse("posts:post_dislike", kwargs={"post_pk": self.post2.id}),
-            follow=True
-        )
-        self.assertRedirects(
-            response,
-            reverse("posts:post_likes", kwargs={"post_pk": self.post2.id})
         )
+        self.assertEqual(response.status_code, 200)
         json_resp = response.json()
-        self.assertTrue("likes" in json_resp)
-        self.assertEqual(json_resp["likes"], 0)
+        self.assertEqual(json_resp, {"likes": 0, "likedByUser": False})
         self.client.logout()
 
+    def test_likes_count_cached_until_likes_change(self):
+        self.assertTrue(self.login_logic(self.username1, self.password1))
+        url = reverse("posts:post_likes", kwargs={"post_pk": self.post2.id})
+        self.assertEqual(self.client.get(url).json()["likes"], 2)
+        # Only the session and the user, the count is cached
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).json()["likes"], 2)
+        Like.objects.get(post=self.post2, owner=self.user2).delete()
+        self.assertEqual(self.client.get(url).json()["likes"], 1)
+        self.client.logout()
+
+    def test_double_like_and_dislike(self):
+        self.assertTrue(self.login_logic(self.username1, self.password1))
+        like_url = reverse("posts:post_like", kwargs={"post_pk": self.post2.id})
+        dislike_url = reverse("posts:post_dislike", kwargs={"post_pk": self.post2.id})
+        # Already liked, nothing changes
+        self.assertEqual(self.client.post(like_url).json(), {"likes": 2, "likedByUser": True})
+        self.assertEqual(self.client.post(dislike_url).json(), {"likes": 1, "likedByUser": False})
+        self.assertEqual(self.client.post(dislike_url).json(), {"likes": 1, "likedByUser": False})
+        self.post2.refresh_from_db()
+        self.assertEqual(self.post2.like_count, 1)
+
+    def test_like_missing_post(self):
+        self.assertTrue(self.login_logic(self.username1, self.password1))
+        for name in ("posts:post_like", "posts:post_dislike"):
+            response = self.client.post(reverse(name, kwargs={"post_pk": self.post2.id + 100}))
+            self.assertEqual(response.status_code, 404)
+
 
 class PostDeleteViewTest(TestCase):
     username1 = "Jack"
@@ -899,6 +1290,40 @@ class SearchViewTest(TestCase):
         self.assertTrue(
             query2.lower() in response.context["post_list"][0].text.lower())
 
+    def test_search_index_follows_post_changes(self):
+        post = Post.objects.get(title="Foo")
+        post.title = "Qux"
+        post.save()
+        response = self.client.get(reverse("posts:post_search") + "?q=qux")
+        self.assertEqual(list(response.context["post_list"]), [post])
+        response = self.client.get(reverse("posts:post_search") + "?q=foo")
+        self.assertEqual(len(response.context["post_list"]), 0)
+        post.delete()
+        response = self.client.get(reverse("posts:post_search") + "?q=qux")
+        self.assertEqual(len(response.context["post_list"]), 0)
+
+    def test_best_matches_first(self):
+        user = User.objects.get(username=self.username)
+        in_text = Post.objects.create(title="Baz", text="Some words about ranking.", owner=user)
+        in_title = Post.objects.create(title="Ranking", text="Some words.", owner=user)
+        response = self.client.get(reverse("posts:post_search") + "?q=rank")
+        self.assertEqual(list(response.context["post_list"]), [in_title, in_text])
+
+    def test_full_text_query_runs_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("posts:post_search") + "?q=foo")
+        search_sql = [query["sql"] for query in queries if "MATCH" in query["sql"]]
+        # Not once per matching post
+        self.assertEqual(len(search_sql), 1)
+        self.assertEqual(search_sql[0].count("MATCH"), 1)
+
+    def test_search_without_full_text_index(self):
+        with mock.patch("posts.search.fts_index_available", return_value=False):
+            response = self.client.get(reverse("posts:post_search") + "?q=oo")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["post_list"]), 1)
+        self.assertEqual(response.context["post_list"][0].title, "Foo")
+
 
 class UserPictureViewTest(TestCase):
     username = "Jack"
@@ -992,6 +1417,8 @@ class LikeListViewTest(TestCase):
             i += 1
 
     def setUp(self):
+        # The ids (thus, the cache keys) are reused between the tests
+        cache.clear()
         self.post = Post.objects.first()
 
     def test_getting_liker_name(self):
@@ -1032,3 +1459,305 @@ class LikeListViewTest(TestCase):
                 owner=self.users[0]
             ).select_related()[0].created_at),
         )
+
+    def test_like_list_by_cursor(self):
+        url = reverse("posts:post_like_list", kwargs={"post_pk": self.post.id})
+        liker_names = []
+        after = ""
+        while True:
+            # The post, the likes chunk (with the likers and their pictures)
+            with self.assertNumQueries(2):
+                response = self.client.get(url + "?limit=2&after=" + after)
+            self.assertEqual(response.status_code, 200)
+            json_resp = response.json()
+            self.assertEqual(json_resp["chunkSize"], 2)
+            self.assertEqual(json_resp["totalLikes"], len(self.users))
+            liker_names += [like["ownerName"] for like in json_resp["likes"]]
+            if not json_resp["hasNext"]:
+                break
+            after = json_resp["nextCursor"]
+        self.assertEqual(liker_names, self.usernames)
+
+
+class AsyncJSONViewsTest(TestCase):
+    """ The JSON endpoints are async views, served through the ASGI handler here """
+
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="Jack", password=cls.password)
+        UserPicture.objects.create(user=cls.user)
+        cls.post = Post.objects.create(title="Async", text="Blah...", owner=cls.user)
+        for i in range(3):
+            Comment.objects.create(text=f"Comment #{i}", post=cls.post, owner=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_are_async(self):
+        for view in (
+            views.PostCommentsView,
+            views.PostLikesCountView,
+            views.PostLikeView,
+            views.PostDislikeView,
+            views.LikeListView,
+        ):
+            self.assertTrue(view.view_is_async, view.__name__)
+
+    async def test_comments_chunks(self):
+        url = reverse("posts:post_comments", kwargs={"post_pk": self.post.pk})
+        response = await self.async_client.get(url + "?limit=2")
+        self.assertEqual(response.status_code, 200)
+        # The queries of the async views are counted too
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+        data = response.json()
+        self.assertEqual([c["text"] for c in data["commentsChunk"]], ["Comment #0", "Comment #1"])
+        response = await self.async_client.get(url + "?limit=2&after=" + data["nextCursor"])
+        data = response.json()
+        self.assertEqual([c["text"] for c in data["commentsChunk"]], ["Comment #2"])
+        self.assertFalse(data["hasNext"])
+        response = await self.async_client.get(url + "?page=2")
+        self.assertEqual(response.json()["pageNumber"], 2)
+        response = await self.async_client.get(
+            reverse("posts:post_comments", kwargs={"post_pk": self.post.pk + 1}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_like_and_dislike(self):
+        like_url = reverse("posts:post_like", kwargs={"post_pk": self.post.pk})
+        dislike_url = reverse("posts:post_dislike", kwargs={"post_pk": self.post.pk})
+        likes_url = reverse("posts:post_likes", kwargs={"post_pk": self.post.pk})
+        response = await self.async_client.post(like_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse("login")))
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.post(like_url)
+        self.assertEqual(response.json(), {"likes": 1, "likedByUser": True})
+        self.assertEqual((await self.async_client.get(likes_url)).json(), {"likes": 1})
+        response = await self.async_client.get(
+            reverse("posts:post_like_list", kwargs={"post_pk": self.post.pk}))
+        self.assertEqual(response.json()["likes"][0]["ownerName"], self.user.username)
+        await self.async_client.post(dislike_url)
+        self.assertEqual((await self.async_client.get(likes_url)).json(), {"likes": 0})
+        # Disliking again is not an error
+        self.assertEqual((await self.async_client.post(dislike_url)).json(), {"likes": 0, "likedByUser": False})
+
+
+class PostCountsViewTest(TestCase):
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="Jack", password=cls.password)
+        other = User.objects.create_user(username="Sparrow", password=cls.password)
+        cls.posts = [Post.objects.create(title=f"Post #{i}", text="Blah...", owner=cls.user) for i in range(3)]
+        Like.objects.create(post=cls.posts[0], owner=cls.user)
+        Like.objects.create(post=cls.posts[0], owner=other)
+        Like.objects.create(post=cls.posts[1], owner=other)
+        Comment.objects.create(text="Nice!", post=cls.posts[2], owner=other)
+
+    def counts_url(self, post_ids):
+        return reverse("posts:post_counts") + "?posts=" + ",".join(str(pk) for pk in post_ids)
+
+    def test_counts_of_many_posts(self):
+        self.client.login(username=self.user.username, password=self.password)
+        post_ids = [post.pk for post in self.posts] + [self.posts[-1].pk + 1]
+        # Session, user and the counts
+        with self.assertNumQueries(3):
+            response = self.client.get(self.counts_url(post_ids))
+        self.assertEqual(response.json(), {"posts": {
+            str(self.posts[0].pk): {"likes": 2, "comments": 0, "likedByUser": True},
+            str(self.posts[1].pk): {"likes": 1, "comments": 0, "likedByUser": False},
+            str(self.posts[2].pk): {"likes": 0, "comments": 1, "likedByUser": False},
+        }})
+
+    def test_anonymous_user(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.counts_url([self.posts[0].pk]))
+        self.assertEqual(
+            response.json()["posts"][str(self.posts[0].pk)],
+            {"likes": 2, "comments": 0, "likedByUser": False},
+        )
+
+    def test_bad_post_ids(self):
+        self.assertEqual(self.client.get(reverse("posts:post_counts")).status_code, 400)
+        self.assertEqual(self.client.get(self.counts_url(range(1, 102))).status_code, 400)
+
+
+@override_settings(POSTS_EVENTS_BROKER="memory")
+class PostEventsViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="Jack", password="pass123")
+        cls.post = Post.objects.create(title="Live", text="Blah...", owner=cls.user)
+        cls.other_post = Post.objects.create(title="Other", text="Blah...", owner=cls.user)
+        Like.objects.create(post=cls.post, owner=cls.user)
+
+    def events_url(self, *post_ids):
+        return reverse("posts:post_events") + "?posts=" + ",".join(str(pk) for pk in post_ids)
+
+    def test_no_stream_under_wsgi(self):
+        self.assertEqual(self.client.get(self.events_url(self.post.pk)).status_code, 204)
+
+    async def test_bad_post_ids(self):
+        response = await self.async_client.get(reverse("posts:post_events") + "?posts=foo")
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(self.events_url(*range(1, 102)))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_stream_counts(self):
+        response = await self.async_client.get(self.events_url(self.post.pk, self.other_post.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content.__aiter__()
+        self.assertEqual(await stream.__anext__(), b"retry: 3000\n\n")
+        # The current counts first
+        snapshot = [await stream.__anext__(), await stream.__anext__()]
+        self.assertIn(
+            f'data: {{"post": {self.post.pk}, "likes": 1, "comments": 0}}'.encode(), b"".join(snapshot))
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                Comment.objects.create(text="Nice!", post=self.post, owner=self.user)
+            with self.captureOnCommitCallbacks(execute=True):
+                Like.objects.get(post=self.post).delete()
+        await sync_to_async(write)()
+        self.assertEqual(
+            await stream.__anext__(),
+            f'event: counts\ndata: {{"post": {self.post.pk}, "comments": 1, "commentsDelta": 1}}\n\n'.encode(),
+        )
+        self.assertEqual(
+            await stream.__anext__(),
+            f'event: counts\ndata: {{"post": {self.post.pk}, "likes": 0, "likesDelta": -1}}\n\n'.encode(),
+        )
+
+    @override_settings(POSTS_EVENTS_STREAM_TIMEOUT=0)
+    async def test_stream_ends(self):
+        response = await self.async_client.get(self.events_url(self.post.pk))
+        stream = response.streaming_content.__aiter__()
+        await stream.__anext__()
+        self.assertTrue(events.get_broker().wants(self.post.pk))
+        # Only the current counts
+        self.assertEqual(len([part async for part in stream]), 1)
+        # The browser reconnects, this stream doesn't wait for the post's events anymore
+        self.assertFalse(events.get_broker().wants(self.post.pk))
+
+
+class CacheBrokerTest(TestCase):
+    @override_settings(POSTS_EVENTS_POLL_INTERVAL=0.01)
+    async def test_events_through_the_cache(self):
+        broker = events.CacheBroker()
+        subscription = events.Subscription([1, 2])
+        broker.subscribe(subscription)
+        try:
+            await sync_to_async(broker.publish)({"post": 3, "likes": 1})
+            await sync_to_async(broker.publish)({"post": 2, "likes": 5})
+            self.assertEqual(await subscription.get(timeout=5), {"post": 2, "likes": 5})
+        finally:
+            broker.unsubscribe(subscription)
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="Jack", password=cls.password)
+        UserPicture.objects.create(user=cls.user)
+        for i in range(3):
+            post = Post.objects.create(title=f"Post #{i}", text="Blah...", owner=cls.user)
+            Like.objects.create(post=post, owner=cls.user)
+            Comment.objects.create(text="Nice!", post=post, owner=cls.user)
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.assertTrue(self.client.login(username=self.user.username, password=self.password))
+
+    def test_read_views(self):
+        post_kwargs = {"post_pk": self.post.pk}
+        # Session, user, user's picture, timeline and the posts
+        self.assertQueryBudget(5, reverse("posts:index"))
+        # And the owner and whether the user follows them
+        self.assertQueryBudget(6, reverse("posts:profile", kwargs={"username": self.user.username}))
+        self.assertQueryBudget(5, reverse(
+            "posts:post_detail", kwargs={"username": self.user.username, "post_pk": self.post.pk}))
+        # The pushed and the pulled posts' ids, then the posts
+        self.assertQueryBudget(6, reverse("posts:feed"))
+        self.assertQueryBudget(5, reverse("posts:trending"))
+        self.assertQueryBudget(5, reverse("posts:post_search") + "?q=blah")
+        # Session, user, the post and the chunk
+        self.assertQueryBudget(4, reverse("posts:post_comments", kwargs=post_kwargs))
+        self.assertQueryBudget(4, reverse("posts:post_like_list", kwargs=post_kwargs))
+        self.assertQueryBudget(3, reverse("posts:post_likes", kwargs=post_kwargs))
+
+    def test_server_timing_and_stats(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse("posts:index"))
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        stats = self.client.get(reverse("posts:stats")).json()
+        self.assertGreaterEqual(stats["queries"]["requests"], 1)
+        self.assertGreater(stats["queries"]["queries"], 0)
+        # The test database's connection stays open, the requests reuse it
+        self.assertGreater(stats["connections"]["reused"], 0)
+        self.assertGreater(stats["connections"]["reuseRate"], 0)
+
+    def test_over_budget_warning_without_transaction_statements(self):
+        url = reverse("posts:post_like", kwargs={"post_pk": self.post.pk})
+        with override_settings(POSTS_QUERY_BUDGET=1), self.assertLogs("posts.queries", "WARNING") as logs:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(url)
+        statements = [query["sql"].split()[0].upper() for query in queries]
+        self.assertIn("SAVEPOINT", statements)
+        self.assertEqual(
+            logs.records[0].request_queries["queries"],
+            len([statement for statement in statements if statement not in ("SAVEPOINT", "RELEASE", "BEGIN")]),
+        )
+
+
+# As with a cache shared between the processes (see 'settings.py')
+@override_settings(
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+    AUTHENTICATION_BACKENDS=["posts.auth.CachedModelBackend"],
+)
+class CachedSessionsTest(QueryBudgetMixin, TestCase):
+    password = "pass123"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="Jack", password=cls.password)
+        UserPicture.objects.create(user=cls.user)
+        cls.post = Post.objects.create(text="Blah...", owner=cls.user)
+        Like.objects.create(post=cls.post, owner=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.assertTrue(self.client.login(username=self.user.username, password=self.password))
+
+    def test_read_views_without_session_and_user_queries(self):
+        # The user with its picture (then it is cached, like the session), timeline and the posts
+        self.assertQueryBudget(3, reverse("posts:index"))
+        # Only the likes count
+        self.assertQueryBudget(1, reverse("posts:post_likes", kwargs={"post_pk": self.post.pk}))
+
+    def test_logged_in_json_without_session_and_user_queries(self):
+        url = reverse("posts:post_likes", kwargs={"post_pk": self.post.pk})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), {"likes": 1})
+        # Until the user changes
+        self.user.first_name = "Jack"
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_cached_user_with_picture(self):
+        url = reverse("posts:post_likes", kwargs={"post_pk": self.post.pk})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).wsgi_request.user.user_picture.picture_path, 1)
+        # A new picture drops the cached user
+        self.user.user_picture.picture_path = 0
+        self.user.user_picture.save()
+        self.assertEqual(self.client.get(url).wsgi_request.user.user_picture.picture_path, 0)
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Post
+
+# The ids of the newest posts, newest first, precomputed so the home page doesn't sort the posts table
+TIMELINE_KEY = "posts:timeline"
+TIMELINE_LOCK_KEY = "posts:timeline:lock"
+
+
+def _timeline_size():
+    return getattr(settings, "POSTS_TIMELINE_SIZE", 300)
+
+
+def _timeline_timeout():
+    # Rebuild it once in a while anyway, in case a rebuild raced with a new post
+    return getattr(settings, "POSTS_TIMELINE_TIMEOUT", 300)
+
+
+def build_timeline():
+    ids = list(
+        Post.objects
+        .order_by("-created_at", "-id")
+        .values_list("id", flat=True)[:_timeline_size()]
+    )
+    cache.set(TIMELINE_KEY, ids, timeout=_timeline_timeout())
+    return ids
+
+
+def newest_ids(count):
+    """ The ids of the newest 'count' posts (up to 'POSTS_TIMELINE_SIZE'), newest first """
+    ids = cache.get(TIMELINE_KEY)
+    if ids is None:
+        ids = build_timeline()
+    return ids[:count]
+
+
+def _update_timeline(change):
+    """
+    Apply 'change' to the cached timeline, or drop the timeline (to be rebuilt on the next read)
+    if 'change' returns 'None' or another request is changing it at the same time, so no update gets lost.
+    """
+    if not cache.add(TIMELINE_LOCK_KEY, 1, timeout=5):
+        cache.delete(TIMELINE_KEY)
+        return
+    try:
+        ids = cache.get(TIMELINE_KEY)
+        if ids is not None:
+            ids = change(ids)
+            if ids is None:
+                cache.delete(TIMELINE_KEY)
+            else:
+                cache.set(TIMELINE_KEY, ids[:_timeline_size()], timeout=_timeline_timeout())
+    finally:
+        cache.delete(TIMELINE_LOCK_KEY)
+
+
+def _update_now_and_on_commit(change):
+    # Now for this request, and again on commit in case a concurrent rebuild missed the change
+    _update_timeline(change)
+    transaction.on_commit(lambda: _update_timeline(change))
+
+
+def push_post(post_pk):
+    """ Put a new post at the top of the timeline """
+    _update_now_and_on_commit(lambda ids: [post_pk] + [pk for pk in ids if pk != post_pk])
+
+
+def remove_post(post_pk):
+    def change(ids):
+        if post_pk in ids and len(ids) >= _timeline_size():
+            # Drop the full timeline, to refill its end from the database
+            return None
+        return [pk for pk in ids if pk != post_pk]
+    _update_now_and_on_commit(change)
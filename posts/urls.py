@@ -6,7 +6,13 @@ app_name = "posts"
 urlpatterns = [
     path('', views.IndexView.as_view(), name="index"),
     path('search/', views.SearchView.as_view(), name="post_search"),
+    path('feed/', views.FeedView.as_view(), name="feed"),
+    path('trending/', views.TrendingView.as_view(), name="trending"),
     path("profile/<username>", views.ProfileView.as_view(), name="profile"),
+    path("profile/<username>/follow/",
+         views.FollowView.as_view(), name="follow"),
+    path("profile/<username>/unfollow/",
+         views.UnfollowView.as_view(), name="unfollow"),
     path("post/add/", views.PostCreateView.as_view(), name="post_create"),
     path("profile/<username>/post/<int:post_pk>/delete/",
          views.PostDeleteView.as_view(), name="post_delete"),
@@ -26,4 +32,7 @@ urlpatterns = [
          views.LikeListView.as_view(), name="post_like_list"),
     path("post/profile/pic/", views.UserPictureView.as_view(),
          name="profile_change_pic"),
+    path("counts/", views.PostCountsView.as_view(), name="post_counts"),
+    path("events/", views.PostEventsView.as_view(), name="post_events"),
+    path("stats/", views.StatsView.as_view(), name="stats"),
 ]
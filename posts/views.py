@@ -1,25 +1,113 @@
+import asyncio
+import json
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.views import generic
-from django.core.paginator import Paginator
 from django.contrib.humanize.templatetags.humanize import naturaltime
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from asgiref.sync import sync_to_async
 from .forms import PostModelForm, CommentModelForm
-from .models import Post, Comment, Like, UserPicture
+from .models import Post, Comment, Like, UserPicture, UserStats, Follow, liked_by
+from .cache import LIKES, COMMENTS, acached_json
+from .pagination import CursorPaginator, paginate_posts, apaginate_chunk, chunk_variant
+from .search import search_posts
+from .templatetags.post_cards import card_cache_stats
+from .middleware import query_stats
+from .backends.sqlite3.base import connection_stats
+from . import events, feed, likes_buffer, timeline
 
 # Create your views here.
 
 
+async def aget_object_or_404(klass, **kwargs):
+    """ 'get_object_or_404()' for the async views (of a model or a queryset) """
+    queryset = klass._default_manager.all() if isinstance(klass, type) else klass
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """ 'LoginRequiredMixin' for the async views (loading the session's user without blocking the event loop) """
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return self.handle_no_permission()
+        return await generic.View.dispatch(self, request, *args, **kwargs)
+
+
+async def redirect_to_login_for_post(post_pk):
+    """ Send the 'GET' requests of the like/dislike endpoints to log in, then back to the post """
+    post = await aget_object_or_404(Post.objects.select_related("owner"), pk=post_pk)
+    return redirect(reverse("login") + "?next=" + reverse(
+        "posts:post_detail",
+        kwargs={
+            "username": post.owner.username,
+            "post_pk": post_pk,
+        },
+    ))
+
+
+@sync_to_async
+def set_like(post_pk, user, liked):
+    """
+    Like (or dislike) the post, doing nothing if it is already liked (or not liked),
+    and return its new (likes count, liked) from the same transaction, or 'None' if there is no such post.
+    """
+    posts = Post.objects.filter(pk=post_pk)
+    with transaction.atomic():
+        state = posts.annotate(liked=liked_by(user)).values_list("like_count", "liked").first()
+        if state is None or state[1] == liked:
+            return state
+        if liked:
+            try:
+                with transaction.atomic():
+                    Like.objects.create(post_id=post_pk, owner=user)
+            except IntegrityError:
+                # Another request of the user saved it in the meantime
+                pass
+        else:
+            # The signals update the post's likes counter
+            Like.objects.filter(post_id=post_pk, owner=user).delete()
+        return posts.values_list("like_count", flat=True).get(), liked
+
+
+async def like_response(request, post_pk, liked):
+    """ Like/dislike the post and answer with its likes count and the user's like (see 'PostCountsView') """
+    if likes_buffer.write_behind_enabled():
+        # The optimistic count, the like is written later (see 'likes_buffer.py')
+        state = await sync_to_async(likes_buffer.toggle_like)(int(post_pk), request.user, liked)
+    else:
+        state = await set_like(int(post_pk), request.user, liked)
+    if state is None:
+        raise Http404("No Post matches the given query.")
+    likes, liked_by_user = state
+    return JsonResponse({"likes": likes, "likedByUser": liked_by_user})
+
+
 class IndexView(generic.ListView):
+    read_from_replica = True
     model = Post
     template_name = "posts/index.html"
     paginate_by = 3
 
     def get_queryset(self):
-        return super().get_queryset().order_by("-created_at")
+        return Post.objects.for_feed(self.request.user).order_by("-created_at")
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.request.GET.get("cursor") or self.request.GET.get("page"):
+            paginator, page_obj = paginate_posts(self.request, queryset, page_size)
+        else:
+            # The first page comes from the precomputed timeline (with one more post to know if there is a next page)
+            paginator = CursorPaginator(queryset, page_size)
+            page_obj = paginator.page_from_ids(timeline.newest_ids(page_size + 1))
+        return (paginator, page_obj, page_obj.object_list, True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -29,26 +117,53 @@ class IndexView(generic.ListView):
 
 
 class ProfileView(generic.View):
+    read_from_replica = True
+
     def get(self, request, username):
-        owner = get_object_or_404(User, username=username)
+        owner = get_object_or_404(User.objects.select_related("user_picture", "stats"), username=username)
+        try:
+            stats = owner.stats
+        except UserStats.DoesNotExist:
+            # A user added without the signals (e.g. by 'bulk_create()')
+            UserStats.objects.refresh([owner.pk])
+            stats = UserStats.objects.get(user=owner)
         post_list = (
             Post.objects
+            .for_feed(request.user)
             .filter(owner=owner)
-            .select_related().order_by("-created_at")
+            .order_by("-created_at")
         )
         # Paginator
-        paginator = Paginator(post_list, 3, allow_empty_first_page=True)
-        # Page number
-        page_number = request.GET.get("page", False)
-        if (page_number):
-            page_obj = paginator.get_page(page_number)
-        else:
-            page_obj = paginator.get_page(1)
+        paginator, page_obj = paginate_posts(request, post_list, 3, count=stats.post_count)
         return render(
             request=request,
             template_name="posts/profile.html",
             context={
                 "owner": owner,
+                "stats": stats,
+                "is_following": (
+                    request.user.is_authenticated
+                    and Follow.objects.filter(follower=request.user, followed=owner).exists()
+                ),
+                "post_list": page_obj.object_list,
+                "object_list": page_obj.object_list,
+                "is_paginated": True,
+                "page_obj": page_obj,
+                "paginator": paginator,
+            }
+        )
+
+
+class FeedView(LoginRequiredMixin, generic.View):
+    """ The posts of the users that the current user follows (and the user's own posts) """
+
+    def get(self, request):
+        paginator = CursorPaginator(Post.objects.for_feed(request.user), 3)
+        page_obj = feed.feed_page(request.user, paginator, request.GET.get("cursor"))
+        return render(
+            request=request,
+            template_name="posts/index.html",
+            context={
                 "post_list": page_obj.object_list,
                 "object_list": page_obj.object_list,
                 "is_paginated": True,
@@ -58,13 +173,64 @@ class ProfileView(generic.View):
         )
 
 
+class TrendingView(generic.View):
+    """ The posts of the last 'POSTS_TRENDING_WINDOW_HOURS' by their trending score, a range of its index per page """
+
+    read_from_replica = True
+
+    def get(self, request):
+        post_list = Post.objects.for_feed(request.user).filter(trending_score__gt=0)
+        paginator = CursorPaginator(post_list, 3, key="trending_score", parse=float)
+        page_obj = paginator.get_page(request.GET.get("cursor"))
+        return render(
+            request=request,
+            template_name="posts/index.html",
+            context={
+                "post_list": page_obj.object_list,
+                "object_list": page_obj.object_list,
+                "is_paginated": True,
+                "page_obj": page_obj,
+                "paginator": paginator,
+            }
+        )
+
+
+class FollowView(LoginRequiredMixin, generic.View):
+    def get(self, request, username):
+        return redirect(reverse("login") + "?next=" + reverse(
+            "posts:profile",
+            kwargs={"username": username},
+        ))
+
+    def post(self, request, username):
+        followed = get_object_or_404(User, username=username)
+        if followed != self.request.user:
+            feed.follow(self.request.user, followed)
+        return redirect(reverse("posts:profile", kwargs={"username": username}))
+
+
+class UnfollowView(LoginRequiredMixin, generic.View):
+    def get(self, request, username):
+        return redirect(reverse("login") + "?next=" + reverse(
+            "posts:profile",
+            kwargs={"username": username},
+        ))
+
+    def post(self, request, username):
+        followed = get_object_or_404(User, username=username)
+        feed.unfollow(self.request.user, followed)
+        return redirect(reverse("posts:profile", kwargs={"username": username}))
+
+
 class PostDetailView(generic.View):
+    read_from_replica = True
+
     def get(self, request, username, post_pk):
         return render(
             request=request,
             template_name="posts/post_detail.html",
             context={
-                "post": get_object_or_404(Post, pk=post_pk),
+                "post": get_object_or_404(Post.objects.for_feed(request.user), pk=post_pk),
             },
         )
 
@@ -111,7 +277,9 @@ class CommentView(LoginRequiredMixin, generic.View):
         comment = comment_form.save(commit=False)
         comment.post = get_object_or_404(Post, pk=post_pk)
         comment.owner = self.request.user
-        comment.save()
+        # Save the comment and bump the post's comments counter together
+        with transaction.atomic():
+            comment.save()
         return redirect(reverse(
             "posts:post_detail",
             kwargs={
@@ -122,84 +290,74 @@ class CommentView(LoginRequiredMixin, generic.View):
 
 
 class PostCommentsView(generic.View):
-    def get(self, request, post_pk):
-        """ Get the queryset of comments and paginate it, then, return the requested page number """
+    read_from_replica = True
+    chunk_size = 2  # The default number of comments per chunk
+    max_chunk_size = 50  # The most a client can ask for at once
+
+    async def get(self, request, post_pk):
+        return JsonResponse(await acached_json(
+            COMMENTS,
+            post_pk,
+            chunk_variant(request, self.chunk_size, self.max_chunk_size),
+            lambda: self.get_comments_chunk(request, post_pk),
+        ))
+
+    async def get_comments_chunk(self, request, post_pk):
+        """ Get the queryset of comments and paginate it, then, return the requested chunk (by cursor or page number) """
+        post = await aget_object_or_404(Post, pk=post_pk)
         # QuerySet
-        comments = Comment.objects.filter(
-            post=get_object_or_404(Post, pk=post_pk),
-        ).select_related().order_by("created_at")
+        comments = (Comment.objects
+                    .filter(post=post)
+                    .select_related("owner", "owner__user_picture")
+                    .order_by("created_at"))
         # Paginator
-        paginator = Paginator(comments, 2, allow_empty_first_page=True)
-        # Page number
-        page_number = request.GET.get("page", False)
-        if (page_number):
-            page_obj = paginator.get_page(page_number)
-        else:
-            page_obj = paginator.get_page(1)
+        paginator, page_obj = await apaginate_chunk(
+            request, comments, self.chunk_size, self.max_chunk_size)
         # Regroup the comments after manipulating its inner data
         comments_chunk = []
-        len_comments_chunk = page_obj.object_list.count()
-        i = 0
-        while i < len_comments_chunk:
-            comment = page_obj.object_list[i]
+        for comment in page_obj.object_list:
             comments_chunk.append({
                 "id": comment.id,
                 "text": comment.text,
-                "postID": comment.post.id,
+                "postID": comment.post_id,
                 "ownerName": comment.owner.username,
                 "ownerPic": comment.owner.user_picture.picture_path,
                 "createdAt": naturaltime(comment.created_at),
                 "updatedAt": naturaltime(comment.updated_at),
             })
-            i += 1
-        return JsonResponse({
+        return {
             "commentsChunk": comments_chunk,
             "hasNext": page_obj.has_next(),
-            "pageNumber": page_obj.number,
-            "commentsCount": paginator.count,
-        })
+            "nextCursor": getattr(page_obj, "next_cursor", None),
+            "pageNumber": getattr(page_obj, "number", None),
+            "commentsCount": post.comment_count,
+        }
 
 
-class PostLikesCountView(LoginRequiredMixin, generic.View):
-    def get(self, request, post_pk):
-        post = get_object_or_404(Post, pk=post_pk)
-        likes = post.likes.count()
-        return JsonResponse({"likes": likes})
+class PostLikesCountView(AsyncLoginRequiredMixin, generic.View):
+    read_from_replica = True
 
+    async def get(self, request, post_pk):
+        async def count():
+            return {"likes": (await aget_object_or_404(Post, pk=post_pk)).like_count}
+        data = await acached_json(LIKES, post_pk, "count", count)
+        return JsonResponse({"likes": likes_buffer.overlay(int(post_pk), request.user, data["likes"], None)[0]})
 
-class PostLikeView(LoginRequiredMixin, generic.View):
-    def get(self, request, post_pk):
-        post = get_object_or_404(Post, pk=post_pk)
-        return redirect(reverse("login") + "?next=" + reverse(
-            "posts:post_detail",
-            kwargs={
-                "username": post.owner.username,
-                "post_pk": post_pk,
-            },
-        ))
 
-    def post(self, request, post_pk):
-        post = get_object_or_404(Post, pk=post_pk)
-        like_obj = Like(post=post, owner=self.request.user)
-        like_obj.save()
-        return redirect(reverse("posts:post_likes", kwargs={"post_pk": post_pk}))
+class PostLikeView(AsyncLoginRequiredMixin, generic.View):
+    async def get(self, request, post_pk):
+        return await redirect_to_login_for_post(post_pk)
 
+    async def post(self, request, post_pk):
+        return await like_response(request, post_pk, True)
 
-class PostDislikeView(LoginRequiredMixin, generic.View):
-    def get(self, request, post_pk):
-        post = get_object_or_404(Post, pk=post_pk)
-        return redirect(reverse("login") + "?next=" + reverse(
-            "posts:post_detail",
-            kwargs={
-                "username": post.owner.username,
-                "post_pk": post_pk,
-            },
-        ))
 
-    def post(self, request, post_pk):
-        post = get_object_or_404(Post, pk=post_pk)
-        get_object_or_404(Like, post=post, owner=self.request.user).delete()
-        return redirect(reverse("posts:post_likes", kwargs={"post_pk": post_pk}))
+class PostDislikeView(AsyncLoginRequiredMixin, generic.View):
+    async def get(self, request, post_pk):
+        return await redirect_to_login_for_post(post_pk)
+
+    async def post(self, request, post_pk):
+        return await like_response(request, post_pk, False)
 
 
 class PostDeleteView(LoginRequiredMixin, generic.View):
@@ -223,60 +381,135 @@ class PostDeleteView(LoginRequiredMixin, generic.View):
 
 
 class LikeListView(generic.View):
-    def get(self, request, post_pk):
-        post = get_object_or_404(Post, pk=post_pk)
+    read_from_replica = True
+    chunk_size = 1  # The default number of likes per chunk
+    max_chunk_size = 100  # The most a client can ask for at once
+
+    async def get(self, request, post_pk):
+        return JsonResponse(await acached_json(
+            LIKES,
+            post_pk,
+            "list&" + chunk_variant(request, self.chunk_size, self.max_chunk_size),
+            lambda: self.get_likes_chunk(request, post_pk),
+        ))
+
+    async def get_likes_chunk(self, request, post_pk):
+        post = await aget_object_or_404(Post, pk=post_pk)
         like_list = (Like.objects
                      .filter(post=post)
-                     .select_related()
+                     .select_related("owner", "owner__user_picture")
                      .order_by("created_at"))
-        chunk_size = 1  # To paginate based on it.
         # Paginator
-        paginator = Paginator(
-            like_list,
-            chunk_size,
-            allow_empty_first_page=True
-        )
-        # Page number
-        page_number = request.GET.get("page", False)
-        if (page_number):
-            page_obj = paginator.get_page(page_number)
-        else:
-            page_obj = paginator.get_page(1)
+        paginator, page_obj = await apaginate_chunk(
+            request, like_list, self.chunk_size, self.max_chunk_size)
         # Regroup the model object data
         likes = []
-        len_like_list = page_obj.object_list.count()
-        i = 0
-        while i < len_like_list:
-            like_obj = page_obj.object_list[i]
+        for like_obj in page_obj.object_list:
             likes.append({
                 "ownerName": like_obj.owner.username,
                 "ownerProfilePage": reverse("posts:profile", kwargs={"username": like_obj.owner.username}),
                 "ownerPic": like_obj.owner.user_picture.picture_path,
                 "createdAt": naturaltime(like_obj.created_at),
             })
-            i += 1
-        return JsonResponse({
+        return {
             "likes": likes,
-            "totalLikes": like_list.count(),
-            "chunkSize": chunk_size,
-        })
+            "totalLikes": post.like_count,
+            "chunkSize": paginator.per_page,
+            "hasNext": page_obj.has_next(),
+            "nextCursor": getattr(page_obj, "next_cursor", None),
+        }
+
+
+def post_ids_of(request, max_posts):
+    """ The unique post ids of the request's '?posts=1,2,3' (in order), or 'None' if there are none or too many """
+    post_ids = []
+    for post_id in request.GET.get("posts", "").split(","):
+        if post_id.isdigit() and int(post_id) not in post_ids:
+            post_ids.append(int(post_id))
+    return post_ids if 0 < len(post_ids) <= max_posts else None
+
+
+class PostCountsView(generic.View):
+    """
+    The likes/comments counts of the '?posts=' ids, and whether the user liked each one,
+    for all the posts of a page in one request (and one query).
+    """
+
+    max_posts = 100  # The most posts at once
+
+    async def get(self, request):
+        post_ids = post_ids_of(request, self.max_posts)
+        if post_ids is None:
+            return HttpResponseBadRequest(f"Pass 1 to {self.max_posts} comma separated post ids as '?posts='.")
+        # Load the session's user without blocking the event loop
+        await sync_to_async(lambda: request.user.is_authenticated)()
+        # The counters are stored on the posts, so there is nothing to group, only the user's like to look up
+        posts = (
+            Post.objects
+            .filter(pk__in=post_ids)
+            .annotate(liked_by_user=liked_by(request.user))
+            .values_list("pk", "like_count", "comment_count", "liked_by_user")
+        )
+        counts = {}
+        async for pk, likes, comments, liked in posts:
+            # With the likes not written yet on top
+            likes, liked = likes_buffer.overlay(pk, request.user, likes, liked)
+            counts[str(pk)] = {"likes": likes, "comments": comments, "likedByUser": liked}
+        return JsonResponse({"posts": counts})
+
+
+class PostEventsView(generic.View):
+    """
+    Stream the likes/comments counts of the '?posts=' ids as Server-Sent Events, their current counts first,
+    then every change (see 'events.py'). Only under ASGI, a WSGI server would hold a thread for each stream.
+    """
+
+    max_posts = 100  # The most posts a stream can follow
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            # 'No Content' tells the 'EventSource' not to reconnect
+            return HttpResponse(status=204)
+        post_ids = post_ids_of(request, self.max_posts)
+        if post_ids is None:
+            return HttpResponseBadRequest(f"Pass 1 to {self.max_posts} comma separated post ids as '?posts='.")
+        response = StreamingHttpResponse(self.stream(post_ids), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # Don't let a proxy (e.g. nginx) buffer the stream
+        return response
+
+    async def stream(self, post_ids):
+        subscription = events.subscribe(post_ids)
+        try:
+            yield "retry: 3000\n\n"
+            async for counts in Post.objects.filter(pk__in=post_ids).values_list("pk", "like_count", "comment_count"):
+                yield self.event({"post": counts[0], "likes": counts[1], "comments": counts[2]})
+            loop = asyncio.get_running_loop()
+            # End the stream once in a while (the browser reconnects), not to keep dead connections forever
+            deadline = loop.time() + getattr(settings, "POSTS_EVENTS_STREAM_TIMEOUT", 300)
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    yield self.event(await subscription.get(min(remaining, 15)))
+                except asyncio.TimeoutError:
+                    # A comment, to keep the connection open through the proxies
+                    yield ": keep-alive\n\n"
+        finally:
+            events.unsubscribe(subscription)
+
+    @staticmethod
+    def event(data):
+        return f"event: counts\ndata: {json.dumps(data)}\n\n"
 
 
 class SearchView(generic.View):
+    read_from_replica = True
+
     def get(self, request):
         query = request.GET.get('q', '')
         if 0 < len(query) < 2048:
-            post_list = Post.objects.filter(
-                Q(title__icontains=query) | Q(text__icontains=query)
-            ).select_related().order_by("-created_at")
+            post_list, ordering = search_posts(Post.objects.for_feed(request.user), query)
             # Paginator
-            paginator = Paginator(post_list, 3, allow_empty_first_page=True)
-            # Page number
-            page_number = request.GET.get("page", False)
-            if (page_number):
-                page_obj = paginator.get_page(page_number)
-            else:
-                page_obj = paginator.get_page(1)
+            paginator, page_obj = paginate_posts(request, post_list, 3, **ordering)
             return render(
                 request=request,
                 template_name="posts/index.html",
@@ -319,3 +552,17 @@ class UserPictureView(LoginRequiredMixin, generic.CreateView):
         UserPicture.objects.filter(user=self.request.user).delete()
         form.instance.user = self.request.user
         return super().form_valid(form)
+
+
+class StatsView(UserPassesTestMixin, generic.View):
+    """ This process's performance counters, for the staff only """
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse({
+            "cardCache": card_cache_stats(),
+            "queries": query_stats(),
+            "connections": connection_stats(),
+        })